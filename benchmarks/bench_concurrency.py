@@ -0,0 +1,126 @@
+"""
+AdaptiveConcurrency against local stand-in server. Server handles `capacity` requests
+in parallel with --delay latency, more in-flight requests get proportionally slower and
+over 2 * capacity get 429; --error-rate of responses are random 503.
+Every mode sends the same number of requests with max_limit threads:
+    fixed-N     ThrottledSession with constant limit N (no adaptation)
+    adaptive    ThrottledSession with AdaptiveConcurrency
+
+    python benchmarks/bench_concurrency.py [--requests 2000] [--capacity 8] [--delay 0.01]
+                                           [--error-rate 0.01] [--max-limit 64]
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [ROOT, BENCH_DIR]
+
+import murinoclub  # noqa: E402
+
+
+def start_server(capacity, delay, error_rate):
+    state = {'in_flight': 0}
+    lock = threading.Lock()
+    rnd = random.Random(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Without it headers and body go in two packets and every response waits for delayed ack
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            with lock:
+                state['in_flight'] += 1
+                in_flight = state['in_flight']
+                failed = rnd.random() < error_rate
+            try:
+                if in_flight > 2 * capacity:
+                    status = 429
+                elif failed:
+                    status = 503
+                else:
+                    status = 200
+                    time.sleep(delay * max(1.0, in_flight / capacity))
+                body = b'{}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_mode(url, requests_count, controller, threads):
+    transport = murinoclub.Transport(pool_connections=1, pool_maxsize=threads)
+    session = murinoclub.ThrottledSession(transport.session, controller)
+    statuses = []
+    latencies = []
+
+    def one(_):
+        started = time.monotonic()
+        response = session.get(url)
+        response.close()
+        statuses.append(response.status_code)
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests_count)))
+    seconds = time.monotonic() - started
+    transport.close()
+    latencies.sort()
+    return {'seconds': seconds, 'rps': requests_count / seconds, 'ok': statuses.count(200),
+            'throttled': statuses.count(429), 'errors': statuses.count(503),
+            'p50_ms': latencies[len(latencies) // 2] * 1000, 'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--capacity', type=int, default=8)
+    arg_parser.add_argument('--delay', type=float, default=0.01)
+    arg_parser.add_argument('--error-rate', type=float, default=0.01)
+    arg_parser.add_argument('--max-limit', type=int, default=64)
+    args = arg_parser.parse_args()
+
+    server = start_server(args.capacity, args.delay, args.error_rate)
+    url = f'http://127.0.0.1:{server.server_address[1]}/api/'
+    modes = [(f'fixed-{limit}', murinoclub.AdaptiveConcurrency(initial=limit, min_limit=limit, max_limit=limit))
+             for limit in (2, args.capacity, args.max_limit)]
+    metrics = murinoclub.Metrics()
+    adaptive = murinoclub.AdaptiveConcurrency(initial=2, max_limit=args.max_limit, metrics=metrics)
+    modes.append(('adaptive', adaptive))
+    for name, controller in modes:
+        result = run_mode(url, args.requests, controller, args.max_limit)
+        print(f'{name:<10}{result["rps"]:>8.0f} req/s  ok {result["ok"]:>5}  429 {result["throttled"]:>5}  '
+              f'503 {result["errors"]:>4}  p50 {result["p50_ms"]:>6.1f} ms  p95 {result["p95_ms"]:>6.1f} ms')
+    limits = [decision['limit'] for decision in adaptive.decisions]
+    print(f'adaptive: final limit {int(adaptive.limit)}, {len(adaptive.decisions)} decisions, '
+          f'limit range {min(limits, default=0)}-{max(limits, default=0)}')
+    print(metrics.to_prometheus(), end='')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
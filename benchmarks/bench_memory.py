@@ -0,0 +1,66 @@
+"""
+Memory of loaded_objects with and without InternTable (BaseParser(intern_strings=True)).
+Every variant is run in separate process, size is measured with tracemalloc as memory
+allocated by extract_many and still kept after it (lots in loaded_objects).
+
+    python benchmarks/bench_memory.py [--sizes 10000 100000] [--fixture recorded.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [ROOT, BENCH_DIR]
+
+import fixtures  # noqa: E402
+
+URL_BASE = 'https://murinoclub.ru/api/estateSearch/'
+COMPLEX_NAME = 'Мурино Клаб (Санкт-Петербург)'
+
+
+def run_one(size, intern_strings, fixture=None):
+    import murinoclub
+
+    payload = fixtures.recorded_payload(fixture, size) if fixture else fixtures.synthetic_payload(size)
+    flats = list(payload['data']['flats'].values())
+    parser = murinoclub.Parser(url_base=URL_BASE, complex_name=COMPLEX_NAME, intern_strings=intern_strings)
+    tracemalloc.start()
+    parser.extract_many(flats)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'size': size, 'intern_strings': intern_strings, 'lots': len(parser.loaded_objects),
+            'kept_mb': round(kept / 2 ** 20, 2), 'peak_mb': round(peak / 2 ** 20, 2),
+            'interned': len(parser.intern_table) if parser.intern_table is not None else 0}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    arg_parser.add_argument('--fixture', help='recorded /api/estateSearch/ response (json)')
+    arg_parser.add_argument('--one', type=int, help=argparse.SUPPRESS)
+    arg_parser.add_argument('--intern', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_one(args.one, args.intern, args.fixture)))
+        return
+
+    for size in args.sizes:
+        results = []
+        for intern_strings in (False, True):
+            command = [sys.executable, __file__, '--one', str(size)] + (['--intern'] if intern_strings else [])
+            if args.fixture:
+                command += ['--fixture', args.fixture]
+            results.append(json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout))
+        plain, interned = results
+        change = (interned['kept_mb'] - plain['kept_mb']) / plain['kept_mb'] * 100 if plain['kept_mb'] else 0
+        print(f'{size:>8} flats: loaded_objects {plain["kept_mb"]} MB -> {interned["kept_mb"]} MB '
+              f'({change:+.1f}%), {interned["interned"]} strings in intern table')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Offline benchmark of murinoclub parser. Every size is run in separate process against
+local http server with synthetic (or recorded) /api/estateSearch/ payload.
+
+Measured for every size:
+    price_seconds   - end-to-end murinoclub.price() (load + output to stdout)
+    stages          - Metrics timers/counters of the same run with metrics enabled
+    peak_rss_mb     - max resident memory of process
+    output_bytes    - size of json written by output_result
+
+    python benchmarks/bench_parser.py [--sizes 1000 10000 100000] [--fixture recorded.json]
+                                      [--output benchmarks/results/NAME.json] [--baseline OLD.json]
+
+Results are saved as json, with --baseline the difference with old results is printed.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [ROOT, BENCH_DIR]
+
+import fixtures  # noqa: E402
+
+API_PATH = '/api/estateSearch/'
+
+
+class CountingStream(io.TextIOBase):
+    # stdout replacement, count written bytes without keeping output in memory
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text.encode('utf-8'))
+        return len(text)
+
+
+def start_server(body):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_one(size, fixture=None):
+    import murinoclub
+
+    payload = fixtures.recorded_payload(fixture, size) if fixture else fixtures.synthetic_payload(size)
+    server = start_server(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    url = f'http://127.0.0.1:{server.server_address[1]}{API_PATH}'
+    del payload
+
+    output = CountingStream()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        murinoclub.price(url_base=url)
+    price_seconds = time.perf_counter() - started
+
+    metrics = murinoclub.Metrics()
+    parser = murinoclub.Parser(url_base=url, complex_name='Мурино Клаб (Санкт-Петербург)', metrics=metrics)
+    with contextlib.redirect_stdout(CountingStream()):
+        parser.load_data()
+        parser.output_result()
+    server.shutdown()
+
+    return {
+        'size': size,
+        'price_seconds': round(price_seconds, 4),
+        'stages': metrics.as_dict(),
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'output_bytes': output.size,
+    }
+
+
+def compare(results, baseline):
+    old = {item['size']: item for item in baseline['results']}
+    for item in results['results']:
+        before = old.get(item['size'])
+        if not before:
+            continue
+        for key in ('price_seconds', 'peak_rss_mb', 'output_bytes'):
+            change = (item[key] - before[key]) / before[key] * 100 if before[key] else 0
+            print(f'{item["size"]:>8} {key:<15}{before[key]:>14}{item[key]:>14}{change:>+9.1f}%')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    arg_parser.add_argument('--fixture', help='recorded /api/estateSearch/ response (json)')
+    arg_parser.add_argument('--output')
+    arg_parser.add_argument('--baseline')
+    arg_parser.add_argument('--one', type=int, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_one(args.one, args.fixture)))
+        return
+
+    revision = git_revision()
+    results = {'revision': revision, 'python': sys.version.split()[0], 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'fixture': args.fixture or 'synthetic', 'results': []}
+    for size in args.sizes:
+        # New process for every size: clean peak memory and no warm caches
+        command = [sys.executable, __file__, '--one', str(size)]
+        if args.fixture:
+            command += ['--fixture', args.fixture]
+        item = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout)
+        results['results'].append(item)
+        print(f'{size:>8} flats: price() {item["price_seconds"]:.2f} s, peak {item["peak_rss_mb"]} MB, '
+              f'output {item["output_bytes"] / 1e6:.1f} MB')
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f'{revision}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print('saved', output)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Payloads of murinoclub.ru /api/estateSearch/ for benchmarks.
+
+synthetic_payload(n) builds {"data": {"flats": {...}}} with n flats, fields are the same
+as in real responses (link, planBig, area, deadlineText, price, isBooked, options, floor,
+type, title). recorded_payload(path, n) loads saved response and repeats its flats up to n.
+"""
+import json
+import random
+
+ROOM_TYPES = ['Студия', '1-комнатная', '2-комнатная', '3-комнатная', '4-комнатная', '2Е', '3Е']
+DEADLINES = ['I кв 2025', 'II кв 2025', 'IV квартал 2025 года', '2026', 'Дом сдан']
+OPTIONS = [[], [{'name': 'Без отделки'}], [{'name': 'Чистовая отделка'}], [{'name': 'White box'}]]
+
+
+def synthetic_flat(number, rnd):
+    rooms = rnd.choice(ROOM_TYPES)
+    area = round(rnd.uniform(19, 130), 1)
+    return {
+        'id': number,
+        'link': f'/flats/{number}/',
+        'planBig': f'/upload/plans/{rooms}-{int(area) // 5}.png',
+        'area': str(area).replace('.', ','),
+        'deadlineText': rnd.choice(DEADLINES),
+        'price': rnd.randrange(3_500_000, 25_000_000, 1000),
+        'isBooked': rnd.random() < 0.1,
+        'options': rnd.choice(OPTIONS),
+        'floor': rnd.randint(1, 25),
+        'type': rooms,
+        'title': f'Квартира № {number}',
+    }
+
+
+def synthetic_payload(count, seed=0):
+    rnd = random.Random(seed)
+    return {'data': {'flats': {str(i): synthetic_flat(i, rnd) for i in range(1, count + 1)}}}
+
+
+def recorded_payload(path, count=None):
+    with open(path, encoding='utf-8') as f:
+        payload = json.load(f)
+    flats = list(payload['data']['flats'].values())
+    if count and flats:
+        flats = [dict(flats[i % len(flats)], link=f'/flats/{i}/', title=f'Квартира № {i}')
+                 for i in range(1, count + 1)]
+    return {'data': {'flats': {str(i): flat for i, flat in enumerate(flats, 1)}}}
@@ -0,0 +1,433 @@
+"""
+Golden-output check for optimized code paths. Runs reference implementation
+(murinoclub.py from git revision or file) and current code on one corpus of raw flat
+dicts and compares pre_json() of every lot field by field. Values are compared with
+type and repr, so Decimal('5.0') vs Decimal('5') or changed rounding is a divergence.
+Lots which raise are compared by exception type and args.
+
+Every check is run for every set of EstateObject options of OPTION_SETS
+(_skip_wrong, _swap_wrong_prices, _split_floors, _collect_issues):
+    sequential          Parser.extract_data for every flat, compared with reference
+                        (with _split_floors floors of split_by_floors too, floors are sent
+                        as strings). Sets with _collect_issues are compared with the same
+                        set without it: errors must be the same, with _skip_wrong lots with
+                        errors must be saved as skipped
+    process_pool        BaseParser.extract_many with extract_workers (passed positionally)
+    pipeline            BaseParser.run_pipeline
+    batch_validation    convert_do_dict with BatchValidator
+Paths are compared with sequential: flats without errors in one run (with quality_report),
+every flat with error alone (exception must be the same).
+    serializer          JSONStreamOutput vs output_result
+    floor_ranges        Utils.split_floors and FloorRanges (parse, in, len, iteration,
+                        split_by_floors) vs FLOOR_CASES, signed and mixed ranges included
+
+    python benchmarks/golden.py (--reference REVISION | --reference-file old.py) [--size 2000]
+                                [--fixture recorded.json]
+
+Reference is required: revision before optimizations (e.g. baseline commit), not HEAD.
+Exit code 1 if any divergence found.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [ROOT, BENCH_DIR]
+
+import fixtures  # noqa: E402
+import murinoclub  # noqa: E402
+
+URL_BASE = 'https://murinoclub.ru/api/estateSearch/'
+COMPLEX_NAME = 'Мурино Клаб (Санкт-Петербург)'
+
+# Values which go by other branches of setters, validators and Decimal rounding.
+# priceSale is not in api, GoldenParser sets it as price_sale (swap and sale price rules)
+EDGE_VALUES = {
+    'price': ['5 500 000 руб.', '4 999 999,50', '7000000.5', '6000001.5', 8000000, '12,5', 'По запросу', '-'],
+    'priceSale': ['4 000 000', '9 999 999', '5000', 7000000, '5 500 000,5'],
+    'area': ['45,55', '30.05', '0,5', 62, '120 м²', '9.99', '99,99999999999999999', '3500'],
+    'floor': ['3/25', '1 из 12', 'цоколь', '-1', 7, '2-4', '-2--1', '-2-3', '-1, 1-3', '1-3, 5', '10-12;14'],
+    'type': ['Студия', 'Евро-2', '3Е', 'Пентхаус', 'св. план', '5-комнатная', 'Машиноместо', '1', '11'],
+    'deadlineText': ['Сдача: IV квартал 2025 г.', 'Март 2026', '2027', 'Заселен', '3 кв. 2025'],
+    'options': [[], [{'name': 'Без отделки'}], [{'name': 'Чистовая'}], [{}]],
+}
+
+OPTION_SETS = [
+    ('default', {}),
+    ('skip_wrong', {'_skip_wrong': True}),
+    ('swap_prices', {'_swap_wrong_prices': True}),
+    ('swap_prices+skip_wrong', {'_swap_wrong_prices': True, '_skip_wrong': True}),
+    ('split_floors', {'_split_floors': True}),
+    ('split_floors+skip_wrong', {'_split_floors': True, '_skip_wrong': True}),
+    ('collect_issues', {'_collect_issues': True}),
+    ('collect_issues+skip_wrong', {'_collect_issues': True, '_skip_wrong': True}),
+    ('collect_issues+swap+skip', {'_collect_issues': True, '_swap_wrong_prices': True, '_skip_wrong': True}),
+]
+
+# floors string, Utils.split_floors (order and repeats of string), FloorRanges.ranges
+FLOOR_CASES = [
+    ('7', [7], [(7, 7)]),
+    ('2-5', [2, 3, 4, 5], [(2, 5)]),
+    ('2 - 4, 7', [2, 3, 4, 7], [(2, 4), (7, 7)]),
+    ('10-12;14', [10, 11, 12, 14], [(10, 12), (14, 14)]),
+    ('3–5', [3, 4, 5], [(3, 5)]),
+    ('5, 2, 5', [5, 2, 5], [(2, 2), (5, 5)]),
+    ('4-2', [], []),
+    ('-1', [-1], [(-1, -1)]),
+    ('-2--1', [-2, -1], [(-2, -1)]),
+    ('-3 - -1', [-3, -2, -1], [(-3, -1)]),
+    ('-2-3', [-2, -1, 0, 1, 2, 3], [(-2, 3)]),
+    ('-1, 1-3', [-1, 1, 2, 3], [(-1, -1), (1, 3)]),
+    ('-2--1; 2, 5-6', [-2, -1, 2, 5, 6], [(-2, -1), (2, 2), (5, 6)]),
+    ('1-3, -1', [1, 2, 3, -1], [(-1, -1), (1, 3)]),
+    ('-1 этаж, 2', [-1, 2], [(-1, -1), (2, 2)]),
+]
+
+
+def corpus(size, fixture=None):
+    payload = fixtures.recorded_payload(fixture, size) if fixture else fixtures.synthetic_payload(size)
+    flats = list(payload['data']['flats'].values())
+    rnd = random.Random(1)
+    for flat in flats[::3]:
+        field = rnd.choice(list(EDGE_VALUES))
+        flat[field] = rnd.choice(EDGE_VALUES[field])
+    return flats
+
+
+def load_reference(revision=None, path=None):
+    if revision:
+        source = subprocess.run(['git', 'show', f'{revision}:murinoclub.py'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        path = os.path.join(tempfile.mkdtemp(), 'murinoclub_reference.py')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+    spec = importlib.util.spec_from_file_location('murinoclub_reference', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class GoldenMixin:
+    # Sets price_sale from priceSale and keeps floors of every saved object
+    def extract_data(self, data, head=None):
+        self._flat = data
+        return super().extract_data(data, head)
+
+    def save_JS_obj(self, obj, extract=True):
+        if obj and self._flat.get('priceSale') is not None:
+            obj.set_price_sale(self._flat['priceSale'])
+        if obj and getattr(obj, '_floors', None):
+            if hasattr(obj, 'split_by_floors'):
+                floors = [item.floor for item in obj.split_by_floors()]
+            else:
+                # Reference keeps list of Utils.split_floors (order and duplicates of string)
+                floors = sorted(set(obj._floors))
+            self.floors = getattr(self, 'floors', []) + [floors]
+        super().save_JS_obj(obj, extract)
+        if obj:
+            self.saved = getattr(self, 'saved', []) + [obj._need_save]
+
+
+class GoldenParser(GoldenMixin, murinoclub.Parser):
+    pass
+
+
+class ListParser(GoldenParser):
+    def fetch_items(self, task):
+        return self.items
+
+
+class PreloadParser(GoldenParser):
+    # Objects are only filled, final_check is done by convert_do_dict
+    def save_JS_obj(self, obj, extract=True):
+        super().save_JS_obj(obj, extract=False)
+
+
+def error_of(error):
+    return ('error', type(error).__name__, _typed(list(error.args)))
+
+
+def _typed(value):
+    if isinstance(value, list):
+        return [_typed(item) for item in value]
+    return type(value).__name__, repr(value)
+
+
+def current_parser(parser_class, options, **kwargs):
+    parser = parser_class(url_base=URL_BASE, complex_name=COMPLEX_NAME, **kwargs)
+    parser.object_options = dict(options)
+    return parser
+
+
+def extract_each(new_parser, flats):
+    # Result of every flat alone: pre_json (with floors of split_by_floors) or error,
+    # so one bad flat doesn't hide others. Quality reports of flats are summed
+    results = []
+    quality = Counter()
+    for flat in flats:
+        parser = new_parser()
+        try:
+            parser.extract_data(flat)
+        except Exception as e:
+            results.append(error_of(e))
+            continue
+        result = dict(parser.loaded_objects[0]) if parser.loaded_objects else None
+        if result is not None:
+            result['<saved>'] = parser.saved[0]
+            if getattr(parser, 'floors', None):
+                result['<floors>'] = parser.floors[0]
+        results.append(result)
+        if hasattr(parser, 'quality_report'):
+            report = parser.quality_report()
+            quality.update({'checked': report['checked'], 'skipped': report['skipped']})
+            quality.update({'issue ' + rule: count for rule, count in report['issues'].items()})
+    return results, quality
+
+
+def reference_each(module, options, flats):
+    class OptionsObject(module.EstateObject):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **dict(options, **kwargs))
+
+    class ReferenceParser(GoldenMixin, module.Parser):
+        pass
+
+    original = module.EstateObject
+    module.EstateObject = OptionsObject
+    try:
+        return extract_each(lambda: ReferenceParser(url_base=URL_BASE, complex_name=COMPLEX_NAME), flats)[0]
+    finally:
+        module.EstateObject = original
+
+
+def diff(name, expected, actual, limit=10):
+    differences = []
+    if len(expected) != len(actual):
+        differences.append(f'{name}: {len(expected)} lots expected, {len(actual)} found')
+    for index, (one, other) in enumerate(zip(expected, actual)):
+        if isinstance(one, dict) and isinstance(other, dict):
+            for field in sorted(set(one) | set(other), key=str):
+                if _typed(one.get(field, '<missing>')) != _typed(other.get(field, '<missing>')):
+                    differences.append(f'{name}: lot {index} field {field}: '
+                                       f'{one.get(field, "<missing>")!r} != {other.get(field, "<missing>")!r}')
+        elif one != other:
+            differences.append(f'{name}: lot {index}: {one!r} != {other!r}')
+    for line in differences[:limit]:
+        print('  ' + line)
+    if len(differences) > limit:
+        print(f'  ... {len(differences) - limit} more')
+    return not differences
+
+
+def without_extra(results):
+    # Only pre_json fields (paths return loaded_objects)
+    return [{key: value for key, value in item.items() if not key.startswith('<')} for item in results]
+
+
+def expected_floors(value):
+    # Floors of string by simple split: '-2--1, 3' is [-2, -1, 3]
+    floors = set()
+    for part in str(value).replace(';', ',').replace('–', '-').split(','):
+        match = re.fullmatch(r'\s*(-?\d+)\s*(?:-\s*(-?\d+))?\s*', part)
+        if not match:
+            return None
+        lo, hi = int(match.group(1)), int(match.group(2) or match.group(1))
+        floors.update(range(lo, hi + 1))
+    return sorted(floors)
+
+
+def accept_fixed_floors(flats, reference, current):
+    """
+    Reference split_floors raises on signed floors ('-1', '-2-3'), current code parses them:
+    such lots are compared with expected_floors instead of reference
+    """
+    accepted = 0
+    result = []
+    for flat, one, other in zip(flats, reference, current):
+        if not isinstance(one, dict) and isinstance(other, dict) and \
+                other.get('<floors>') == expected_floors(flat['floor']) is not None:
+            one = other
+            accepted += 1
+        result.append(one)
+    return result, accepted
+
+
+def collect_expected(plain, collect_skip):
+    # Errors of plain mode are skipped lots in collect mode with _skip_wrong
+    return [other if not isinstance(one, dict) and isinstance(other, dict) and not other['<saved>'] else one
+            for one, other in zip(plain, collect_skip)]
+
+
+def check_path(name, run, flats, expected, quality):
+    """
+    run(flats, parser) -> parser with loaded_objects. Flats without errors are run together,
+    flats with errors one by one
+    """
+    good = [flat for flat, result in zip(flats, expected) if isinstance(result, dict)]
+    good_expected = without_extra([result for result in expected if isinstance(result, dict)])
+    parser = run(good)
+    ok = diff(name, good_expected, parser.loaded_objects)
+    report = parser.quality_report()
+    actual_quality = Counter({'checked': report['checked'], 'skipped': report['skipped']})
+    actual_quality.update({'issue ' + rule: count for rule, count in report['issues'].items()})
+    ok = diff(name + ' quality', sorted(quality.items()), sorted(actual_quality.items())) and ok
+    errors = [(flat, result) for flat, result in zip(flats, expected) if not isinstance(result, dict)]
+    actual_errors = []
+    for flat, result in errors:
+        try:
+            parser = run([flat])
+            actual_errors.append(without_extra(parser.loaded_objects)[0] if parser.loaded_objects else None)
+        except Exception as e:
+            actual_errors.append(error_of(e))
+    return diff(name + ' errors', [result for _, result in errors], actual_errors) and ok
+
+
+def process_pool_run(options):
+    # extract_workers and extract_chunk_size are positional: workers must not start their own pools
+    parser = GoldenParser(URL_BASE, COMPLEX_NAME, 2, 97)
+    parser.object_options = dict(options)
+
+    def run(flats):
+        parser.loaded_objects = []
+        parser.reset_quality()
+        parser.extract_many(flats)
+        return parser
+    return run, parser
+
+
+def pipeline_run(options):
+    def run(flats):
+        parser = current_parser(ListParser, options)
+        parser.items = flats
+        # One worker in every stage keeps order of lots
+        parser.run_pipeline(['flat'], fetch_workers=1, extract_workers=1, check_workers=1, queue_size=50)
+        return parser
+    return run
+
+
+def batch_validation_run(options):
+    def run(flats):
+        parser = current_parser(PreloadParser, options)
+        parser.batch_validation = True
+        for flat in flats:
+            parser.extract_data(flat)
+        parser.convert_do_dict()
+        return parser
+    return run
+
+
+def check_serializer(flats):
+    parser = murinoclub.Parser(url_base=URL_BASE, complex_name=COMPLEX_NAME)
+    parser.extract_many(flats + flats[:10])
+    # Equal records with other key order and numbers of other types are duplicates too
+    parser.loaded_objects += [dict(reversed(list(record.items()))) for record in parser.loaded_objects[:10]]
+    parser.loaded_objects += [{key: float(value) if isinstance(value, int) and not isinstance(value, bool) else value
+                               for key, value in record.items()} for record in parser.loaded_objects[10:20]]
+    expected = io.StringIO()
+    with contextlib.redirect_stdout(expected):
+        parser.output_result()
+    actual = io.StringIO()
+    output = murinoclub.JSONStreamOutput(actual)
+    for element in parser.loaded_objects:
+        output.write(element)
+    output.close()
+    return diff('serializer', expected.getvalue().splitlines(), actual.getvalue().splitlines())
+
+
+def check_floor_ranges():
+    expected, actual = [], []
+    for floors_str, floors, ranges in FLOOR_CASES:
+        floor_ranges = murinoclub.FloorRanges.parse(floors_str)
+        members = sorted(set(floors))
+        probes = range(min(members or [0]) - 2, max(members or [0]) + 3)
+        obj = murinoclub.EstateObject()
+        obj._floors = floor_ranges
+        expected.append((floors_str, floors, ranges, members, len(members),
+                         [floor in members for floor in probes], members or [None]))
+        actual.append((floors_str, murinoclub.Utils.split_floors(floors_str), floor_ranges.ranges,
+                       list(floor_ranges), len(floor_ranges), [floor in floor_ranges for floor in probes],
+                       [item.floor for item in obj.split_by_floors()]))
+    return diff('floor_ranges', expected, actual)
+
+
+def check_option_set(reference, flats, set_name, options):
+    checks = []
+    if options.get('_split_floors'):
+        # Reference split_floors works only with strings
+        flats = [dict(flat, floor=str(flat['floor'])) for flat in flats]
+    expected, quality = extract_each(lambda: current_parser(GoldenParser, options), flats)
+    accepted = 0
+    if options.get('_collect_issues'):
+        # Collect mode must give the same lots and errors as raising mode
+        plain = {key: value for key, value in options.items() if key != '_collect_issues'}
+        baseline = extract_each(lambda: current_parser(GoldenParser, plain), flats)[0]
+        if options.get('_skip_wrong'):
+            baseline = collect_expected(baseline, expected)
+    else:
+        baseline = reference_each(reference, options, flats)
+        if options.get('_split_floors'):
+            baseline, accepted = accept_fixed_floors(flats, baseline, expected)
+    checks.append(('sequential', lambda: diff('sequential', baseline, expected)))
+    pool_run, pool_parser = process_pool_run(options)
+    checks += [('process_pool', lambda: check_path('process_pool', pool_run, flats, expected, quality)),
+               ('pipeline', lambda: check_path('pipeline', pipeline_run(options), flats, expected, quality)),
+               ('batch_validation', lambda: check_path('batch_validation', batch_validation_run(options),
+                                                       flats, expected, quality))]
+    failed = []
+    try:
+        for name, check in checks:
+            ok = check()
+            print(f'{set_name:<28}{name:<20}{"ok" if ok else "DIVERGED"}')
+            if not ok:
+                failed.append(f'{set_name}/{name}')
+    finally:
+        pool_parser.close_extract_pool()
+    errors = sum(not isinstance(result, dict) for result in expected)
+    if accepted:
+        print(f'{set_name:<28}{accepted} lots with signed floors (reference raised) checked by expected_floors')
+    return failed, errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--reference', help='git revision of reference murinoclub.py (before optimizations)')
+    arg_parser.add_argument('--reference-file', help='reference murinoclub.py file (instead of revision)')
+    arg_parser.add_argument('--size', type=int, default=2000)
+    arg_parser.add_argument('--fixture', help='recorded /api/estateSearch/ response (json)')
+    args = arg_parser.parse_args()
+    if not args.reference and not args.reference_file:
+        arg_parser.error('--reference or --reference-file is required (HEAD would compare code with itself)')
+
+    flats = corpus(args.size, args.fixture)
+    reference = load_reference(None if args.reference_file else args.reference, args.reference_file)
+    failed = []
+    for set_name, options in OPTION_SETS:
+        set_failed, errors = check_option_set(reference, flats, set_name, options)
+        failed += set_failed
+        print(f'{set_name:<28}{len(flats)} flats, {errors} with errors')
+    good_flats = [flat for flat, result in zip(flats, extract_each(
+        lambda: current_parser(GoldenParser, {}), flats)[0]) if isinstance(result, dict)]
+    ok = check_serializer(good_flats)
+    print(f'{"default":<28}{"serializer":<20}{"ok" if ok else "DIVERGED"}')
+    if not ok:
+        failed.append('default/serializer')
+    ok = check_floor_ranges()
+    print(f'{"default":<28}{"floor_ranges":<20}{"ok" if ok else "DIVERGED"}')
+    if not ok:
+        failed.append('default/floor_ranges')
+    if failed:
+        print('diverged:', ', '.join(failed))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Startup benchmark of parser script: runs `python -X importtime -c "import murinoclub"`
+and shows the slowest imports. Fails (exit code 1) if heavy modules are imported
+at module load or if import takes more than budget.
+
+    python benchmarks/startup.py [--budget-ms 60] [--top 15] [--runs 5]
+
+Note: a script started as `python murinoclub.py` is compiled on every run (no .pyc for
+__main__), `python -c "import murinoclub; murinoclub.price()"` uses cached bytecode.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Must be loaded only when they are really needed
+LAZY_MODULES = ['requests', 'urllib3', 'bs4', 'multiprocessing', 'concurrent.futures.process']
+
+
+def import_times():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import murinoclub'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--budget-ms', type=float, default=60)
+    arg_parser.add_argument('--top', type=int, default=15)
+    arg_parser.add_argument('--runs', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    # Best of runs: less noise from other processes
+    times = min(runs, key=lambda t: t['murinoclub'][1])
+    total_ms = times['murinoclub'][1] / 1000
+    print(f'{"module":<50}{"self ms":>10}{"cumul. ms":>12}')
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda x: -x[1][1])[:args.top]:
+        print(f'{name:<50}{self_us / 1000:>10.2f}{cumulative_us / 1000:>12.2f}')
+    print(f'\nimport murinoclub: {total_ms:.2f} ms (budget {args.budget_ms} ms)')
+
+    errors = [f'{name} is imported at startup' for name in LAZY_MODULES if name in times]
+    if total_ms > args.budget_ms:
+        errors.append(f'import takes {total_ms:.2f} ms, budget is {args.budget_ms} ms')
+    for error in errors:
+        print('FAIL:', error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,25 @@
-import requests
 import json
-import urllib3
 import re
 import time
+import random
+import os
+import copy
+import bisect
+import struct
+import functools
 import logging
 from time import strptime
 import sys
-from bs4 import BeautifulSoup, Tag
+import threading
+from collections import Counter, deque, namedtuple
+import queue
 from urllib.parse import urljoin, urlparse
 from decimal import Decimal
 
 from urllib.error import HTTPError
 
-urllib3.disable_warnings()
+# requests, urllib3 and bs4 are imported on first use (see Transport and Utils.is_tag),
+# check startup time with benchmarks/startup.py
 logger = logging.getLogger()
 # logger.setLevel(logging.DEBUG)
 # if sys.platform == 'darwin':
@@ -20,6 +27,9 @@ logger = logging.getLogger()
 # else:
 #     logging.basicConfig(stream=sys.stdout, level=logging.CRITICAL)
 
+# Problem of lot data found by setter or validator in collect mode (EstateObject._collect_issues)
+ValidationIssue = namedtuple('ValidationIssue', ['rule', 'message', 'args'])
+
 
 class EstateObject():
 
@@ -65,6 +75,11 @@ class EstateObject():
         self._auto_correct_price = False
         self._validate_data = True
         self._need_save = True
+        # With _collect_issues setters and validators don't raise, but save problems to _issues
+        self._collect_issues = False
+        self._issues = []
+        # InternTable of run: equal strings of many lots are kept as one object
+        self._intern_table = None
         self._resort_obj_types()
         # self._mapper = TableMapper()
         for key, value in kwargs.items():
@@ -104,6 +119,16 @@ class EstateObject():
         self.discount = None
         self.flat_url = None
 
+    def _intern(self, value):
+        if self._intern_table is None:
+            return value
+        return self._intern_table.intern(value)
+
+    def _issue(self, rule, message, *args):
+        if not self._collect_issues:
+            raise Exception(message, *args)
+        self._issues.append(ValidationIssue(rule, message, args))
+
     def _resort_obj_types(self):
         pairs = []
         for obj_type, text_names in self.type_by_names.items():
@@ -130,7 +155,7 @@ class EstateObject():
         restricted_parts = ['\t', '\n', '\xad', '(дом сдан)', 'дом сдан']
         value = self.remove_restricted(value, restricted_parts)
         value = value.title().replace('Жк', 'ЖК')
-        self.complex = value
+        self.complex = self._intern(value)
 
     def find_obj_type_by_value(self, value):
         for obj_type, text_name in self._type_by_names:
@@ -145,7 +170,7 @@ class EstateObject():
                     self._need_save = False
                 self.type = found_type
             else:
-                raise Exception('Fount new obj type name', value)
+                return self._issue('obj_type', 'Fount new obj type name', value)
             if 'пентхаус' in value:
                 self.set_feature('Пентхаус')
         else:
@@ -203,7 +228,7 @@ class EstateObject():
         if price and not self._ignore_small_prices:
             if (price > 0 and price < 10000) or \
                     price > 1000000 * 100000:
-                raise Exception('Wrong price value')
+                self._issue('price_value', 'Wrong price value')
 
     def set_price_base(self, value, sale=None, multi=1):
         if self._project_price_multi:
@@ -246,8 +271,8 @@ class EstateObject():
                 if self._correct_type_dynamic:
                     self.type = found_type
                 else:
-                    raise Exception('Find {} in number, but type is {}, extected type: {}'.
-                                    format(value, self.type, found_type))
+                    self._issue('type_in_number', 'Find {} in number, but type is {}, extected type: {}'.
+                                format(value, self.type, found_type))
 
     def set_number(self, value):
         self.check_is_object_type_valid(value)
@@ -327,7 +352,7 @@ class EstateObject():
                                 self.rooms = int(num[0])
                             else:
                                 if not self._ignore_empty_rooms:
-                                    raise Exception('No digits find in room field', value)
+                                    return self._issue('rooms', 'No digits find in room field', value)
         else:
             self.rooms = int(value)
         if self.rooms == 0:
@@ -349,7 +374,7 @@ class EstateObject():
             if '/' in value:
                 value = value.split('/')[0]
         if self._split_floors:
-            self._floors = Utils.split_floors(value)
+            self._floors = FloorRanges.parse(value)
         else:
             if value:
                 if isinstance(value, str):
@@ -412,14 +437,19 @@ class EstateObject():
         elif value in self._not_in_sale_statuses:
             value = 0
         if value:
-            value = int(value)
+            try:
+                value = int(value)
+            except ValueError:
+                if not self._collect_issues:
+                    raise
+                return self._issue('in_sale', 'Wrong object in_sale attribute', value)
         if value not in [0, 1, None]:
-            raise Exception('Wrong object in_sale attribute', value)
+            return self._issue('in_sale', 'Wrong object in_sale attribute', value)
         self.in_sale = value
 
     def set_finished(self, value=0):
         if value not in [0, 1, None, 'optional']:
-            raise Exception('Wrong object finished attribute', value)
+            return self._issue('finished', 'Wrong object finished attribute', value)
         self.finished = value
 
     def set_currency(self, value):
@@ -430,13 +460,13 @@ class EstateObject():
     def set_sale_status(self, value):
         restricted_parts = ['статус', ':']
         value = self.remove_restricted(value, restricted_parts)
-        self.sale_status = value
+        self.sale_status = self._intern(value)
 
     def set_living_area(self, value):
         if value:
             if not isinstance(value, str) or value.lower().strip() not in self.empty_values:
                 if self._used_rooms_for_search_liv_area:
-                    raise Exception('tried get area from rooms area and from liv_area field')
+                    return self._issue('living_area_source', 'tried get area from rooms area and from liv_area field')
                 self.living_area = self._area_cleaner(value)
 
     def set_ceil(self, value):
@@ -485,7 +515,7 @@ class EstateObject():
 
     def set_furniture(self, value=0):
         if value not in [0, 1, 'optional', None]:
-            raise Exception('Wrong object furniture attribute', value)
+            return self._issue('furniture', 'Wrong object furniture attribute', value)
         self.furniture = value
 
     def set_comissioning(self, value, time_mask=None):
@@ -504,7 +534,7 @@ class EstateObject():
                 self.comissioning = "сдан"
                 return
             if re.search(r'^\d\d\d\d$', value.strip()):
-                self.comissioning = value.strip()
+                self.comissioning = self._intern(value.strip())
                 return
 
             match = re.search(r'(?:январь|февраль|март|апрель|май|июнь|июль|август|сентябрь|октябрь|ноябрь|декабрь)', value, flags=re.I)
@@ -528,22 +558,22 @@ class EstateObject():
             value = re.sub('3 кв', 'III кв', value, flags=re.I)
             value = re.sub('4 кв', 'IV кв', value, flags=re.I)
             value = value.strip()
-            self.comissioning = value
+            self.comissioning = self._intern(value)
 
     def set_plan(self, value, base_url=None, add_base_if_none=True):
         if value:
-            if isinstance(value, Tag):
+            if Utils.is_tag(value):
                 value = value.img['src']
             if base_url:
                 value = urljoin(base_url, value)
             if add_base_if_none and 'http' not in value:
                 value = urljoin(Utils.get_domain(self._site_url), value)
-            self.plan = value
+            self.plan = self._intern(value)
 
     def set_feature(self, value):
         if value:
             restricted_parts = ['\t', '\n']
-            value = self.remove_restricted(value, restricted_parts)
+            value = self._intern(self.remove_restricted(value, restricted_parts))
             if 'евро' in value.lower():
                 self.euro_planning = 1
                 return
@@ -558,7 +588,7 @@ class EstateObject():
     def set_view(self, value):
         if value:
             restricted_parts = ['\t', '\n']
-            value = self.remove_restricted(value, restricted_parts)
+            value = self._intern(self.remove_restricted(value, restricted_parts))
             if self.view:
                 self.view.append(value)
             else:
@@ -567,7 +597,7 @@ class EstateObject():
     def set_euro_planning(self, value):
         value = int(value)
         if value not in [0, 1, None]:
-            raise Exception('Wrong object euro_planning attribute', value)
+            return self._issue('euro_planning', 'Wrong object euro_planning attribute', value)
         self.euro_planning = value
 
     def set_sale(self, value):
@@ -646,7 +676,7 @@ class EstateObject():
         if self.living_area is None:
             self.living_area = 0
         if not self._used_rooms_for_search_liv_area and self.living_area:
-            raise Exception('tried get area from rooms area after get it from liv_area field')
+            return self._issue('living_area_source', 'tried get area from rooms area after get it from liv_area field')
         self.living_area += value
         self._used_rooms_for_search_liv_area = True
 
@@ -654,7 +684,7 @@ class EstateObject():
         try:
             if self._validate_data:
                 self._validate_obj_data()
-            if self._validate_price:
+            if self._validate_price and not self._issues:
                 self._validate_prices()
         except:
             if not self._skip_wrong:
@@ -662,6 +692,12 @@ class EstateObject():
             else:
                 self._need_save = False
                 return False
+        if self._issues:
+            if not self._skip_wrong:
+                issue = self._issues[0]
+                raise Exception(issue.message, *issue.args)
+            self._need_save = False
+            return False
         self._clear_rooms_by_not_flats()
         self._set_not_in_sale_if_no_price()
         self._swap_base_price_and_finish_price()
@@ -702,23 +738,23 @@ class EstateObject():
     def _validate_obj_data(self):
         if isinstance(self.rooms, int) and self.rooms > 10:
             if self.area and self.area < 100:
-                raise Exception('too big room count and small area', self.rooms, self.area)
+                return self._issue('rooms_area', 'too big room count and small area', self.rooms, self.area)
         if isinstance(self.rooms, int) and self.rooms > 30:
-            raise Exception('too big room count', self.rooms)
+            return self._issue('rooms_count', 'too big room count', self.rooms)
         if self.floor and self.floor > 100:
-            raise Exception('too big floor number', self.floor)
+            return self._issue('floor', 'too big floor number', self.floor)
         if self.type == 'flat' or self.type == 'apartment':
             if self.area and self.area < 10:
-                raise Exception('too small area for flat', self.area)
+                return self._issue('flat_area_small', 'too small area for flat', self.area)
             if self.area and self.area > 3000:
-                raise Exception('too big area for flat', self.area)
+                return self._issue('flat_area_big', 'too big area for flat', self.area)
         if self.area and self.living_area and self.living_area > self.area:
-            raise Exception(f'living_area `{self.living_area}` bigger then area `{self.area}`')
+            return self._issue('living_area', f'living_area `{self.living_area}` bigger then area `{self.area}`')
         if self.type == 'parking':
             if self.area and self.area > 50:
-                raise Exception('too big area for parking', self.area)
+                return self._issue('parking_area', 'too big area for parking', self.area)
         if self.area and self.area <= 1:
-            raise Exception('area <= 1', self.area)
+            return self._issue('area', 'area <= 1', self.area)
 
     def _validate_prices(self):
         if self.price_base and self.price_sale:
@@ -726,32 +762,51 @@ class EstateObject():
                 if self._swap_wrong_prices:
                     self.price_base, self.price_sale = self.price_sale, self.price_base
                 else:
-                    raise Exception('Wrond sale price', self.price_base,
-                                    self.price_sale)
+                    return self._issue('sale_price', 'Wrond sale price', self.price_base,
+                                       self.price_sale)
 
         if self.price_finished and self.price_finished_sale:
             if self.price_finished < self.price_finished_sale:
                 if self._swap_wrong_prices:
                     self.price_finished, self.price_finished_sale = self.price_finished_sale, self.price_finished
                 else:
-                    raise Exception('Wrond price_finished_sale price',
-                                    self.price_finished,
-                                    self.price_finished_sale)
+                    return self._issue('finished_sale_price', 'Wrond price_finished_sale price',
+                                       self.price_finished,
+                                       self.price_finished_sale)
 
         if self.discount_percent and self.discount_percent > 30:
-            raise Exception('Too big discount rate', self.discount_percent)
+            return self._issue('discount', 'Too big discount rate', self.discount_percent)
 
         if self.type == 'flat' or self.type == 'commercial' or self.type == 'apartment':
             if self.price_sale and self.price_sale < self._minimal_allowed_price:
-                raise Exception('Too small price_sale', self.price_sale)
+                return self._issue('small_price_sale', 'Too small price_sale', self.price_sale)
             if self.price_base and self.price_base < self._minimal_allowed_price:
-                raise Exception('Too small price_base', self.price_base)
+                return self._issue('small_price_base', 'Too small price_base', self.price_base)
             if self.price_finished_sale and self.price_finished_sale < self._minimal_allowed_price:
-                raise Exception('Too small price_finished_sale', self.price_finished_sale)
+                return self._issue('small_price_finished_sale', 'Too small price_finished_sale',
+                                   self.price_finished_sale)
             if self.price_finished and self.price_finished < self._minimal_allowed_price:
-                raise Exception('Too small price_finished', self.price_finished)
+                return self._issue('small_price_finished', 'Too small price_finished', self.price_finished)
+
+    def split_by_floors(self):
+        """
+        Yield copy of object for every floor of _floors (see FloorRanges), objects are
+        created lazily, only when consumer iterates. Without _floors yield object itself
+        """
+        if not self._floors:
+            yield self
+            return
+        for floor in self._floors:
+            obj = copy.copy(self)
+            obj.__dict__ = {k: list(v) if isinstance(v, list) else v for k, v in self.__dict__.items()}
+            obj.floor = floor
+            obj._floors = None
+            yield obj
 
     def pre_json(self):
+        if self._intern_table is not None:
+            return self._intern_table.intern_record(
+                {k: v for k, v in self.__dict__.items() if not k.startswith('_')})
         return {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
 
     def __eq__(self, other):
@@ -764,13 +819,1027 @@ class EstateObject():
         return str(self.__dict__)
 
 
+class InternTable:
+    """
+    Per-run table of strings: intern(value) returns the first equal string seen in run,
+    so complex, type, comissioning, sale_status, plan, feature ... of all lots in
+    loaded_objects share one object each. Unlike sys.intern strings are freed with table.
+    Only str values are interned (equal Decimals can have different repr), fields unique
+    for every lot are not put to table.
+    """
+    unique_fields = frozenset(['number', 'number_on_site', 'flat_url', 'article'])
+
+    def __init__(self):
+        self._table = {}
+
+    def intern(self, value):
+        if type(value) is str:
+            return self._table.setdefault(value, value)
+        return value
+
+    def intern_record(self, record):
+        setdefault = self._table.setdefault
+        for key, value in record.items():
+            if key in self.unique_fields:
+                continue
+            if type(value) is str:
+                record[key] = setdefault(value, value)
+            elif type(value) is list:
+                record[key] = [setdefault(item, item) if type(item) is str else item for item in value]
+        return record
+
+    def __len__(self):
+        return len(self._table)
+
+
+class BatchValidator:
+    """
+    Vectorized EstateObject.final_check for many objects at once (needs numpy, without it
+    objects are checked one by one). Rules and their order are the same as in
+    _validate_obj_data and _validate_prices, error code is the first failed rule of row.
+    Areas and prices are compared as float64, rows with values which are not exact in float64,
+    failed rows and rows with issues of setters are checked by obj.final_check() (so result,
+    exception and issues are the same as in per-object path).
+    """
+    OK = 0
+    rules = {
+        1: ('rooms_area', 'too big room count and small area'),
+        2: ('rooms_count', 'too big room count'),
+        3: ('floor', 'too big floor number'),
+        4: ('flat_area_small', 'too small area for flat'),
+        5: ('flat_area_big', 'too big area for flat'),
+        6: ('living_area', 'living_area bigger then area'),
+        7: ('parking_area', 'too big area for parking'),
+        8: ('area', 'area <= 1'),
+        9: ('sale_price', 'Wrond sale price'),
+        10: ('finished_sale_price', 'Wrond price_finished_sale price'),
+        11: ('discount', 'Too big discount rate'),
+        12: ('small_price_sale', 'Too small price_sale'),
+        13: ('small_price_base', 'Too small price_base'),
+        14: ('small_price_finished_sale', 'Too small price_finished_sale'),
+        15: ('small_price_finished', 'Too small price_finished'),
+    }
+    numeric_columns = ['area', 'living_area', 'floor', 'rooms', 'price_base', 'price_sale',
+                       'price_finished', 'price_finished_sale', 'discount_percent']
+
+    @staticmethod
+    def _to_number(value):
+        if value is None or isinstance(value, (str, bool)):
+            return float('nan')
+        return float(value)
+
+    @staticmethod
+    def _is_exact(value):
+        # Decimal and int are compared with float exactly
+        return value is None or isinstance(value, (str, bool)) or float(value) == value
+
+    def collect_columns(self, objects):
+        columns = {name: [self._to_number(getattr(obj, name)) for obj in objects]
+                   for name in self.numeric_columns}
+        # rooms rules work only with int rooms ('studio' is skipped)
+        columns['rooms'] = [float(obj.rooms) if isinstance(obj.rooms, int) and not isinstance(obj.rooms, bool)
+                            else float('nan') for obj in objects]
+        columns['type'] = [obj.type for obj in objects]
+        columns['validate_data'] = [bool(obj._validate_data) for obj in objects]
+        columns['validate_price'] = [bool(obj._validate_price) for obj in objects]
+        columns['swap_wrong_prices'] = [bool(obj._swap_wrong_prices) for obj in objects]
+        columns['minimal_allowed_price'] = [float(obj._minimal_allowed_price) for obj in objects]
+        columns['exact'] = [all(self._is_exact(getattr(obj, name)) for name in self.numeric_columns) and
+                            self._is_exact(obj._minimal_allowed_price) for obj in objects]
+        return columns
+
+    def error_codes(self, columns):
+        """
+        Return (codes, swap_base, swap_finished) arrays, swap_* mark rows where prices must be swapped
+        """
+        import numpy as np
+
+        col = {name: np.asarray(columns[name], dtype=np.float64) for name in self.numeric_columns}
+        # Same as python truth check `if value`: not None and not 0
+        has = {name: ~np.isnan(values) & (values != 0) for name, values in col.items()}
+        types = np.asarray(columns['type'], dtype=object)
+        validate_data = np.asarray(columns['validate_data'], dtype=bool)
+        validate_price = np.asarray(columns['validate_price'], dtype=bool)
+        swap = np.asarray(columns['swap_wrong_prices'], dtype=bool)
+        minimal = np.asarray(columns['minimal_allowed_price'], dtype=np.float64)
+        is_int_rooms = ~np.isnan(col['rooms'])
+        is_flat = np.isin(types, ['flat', 'apartment'])
+        area, has_area = col['area'], has['area']
+
+        with np.errstate(invalid='ignore'):
+            data_rules = [
+                is_int_rooms & (col['rooms'] > 10) & has_area & (area < 100),
+                is_int_rooms & (col['rooms'] > 30),
+                has['floor'] & (col['floor'] > 100),
+                is_flat & has_area & (area < 10),
+                is_flat & has_area & (area > 3000),
+                has_area & has['living_area'] & (col['living_area'] > area),
+                (types == 'parking') & has_area & (area > 50),
+                has_area & (area <= 1),
+            ]
+            wrong_base = has['price_base'] & has['price_sale'] & (col['price_base'] < col['price_sale'])
+            wrong_finished = (has['price_finished'] & has['price_finished_sale'] &
+                              (col['price_finished'] < col['price_finished_sale']))
+            swap_base = validate_price & swap & wrong_base
+            swap_finished = validate_price & swap & wrong_finished
+            price_base = np.where(swap_base, col['price_sale'], col['price_base'])
+            price_sale = np.where(swap_base, col['price_base'], col['price_sale'])
+            price_finished = np.where(swap_finished, col['price_finished_sale'], col['price_finished'])
+            price_finished_sale = np.where(swap_finished, col['price_finished'], col['price_finished_sale'])
+            min_price_type = np.isin(types, ['flat', 'commercial', 'apartment'])
+            price_rules = [
+                wrong_base & ~swap,
+                wrong_finished & ~swap,
+                has['discount_percent'] & (col['discount_percent'] > 30),
+                min_price_type & has['price_sale'] & (price_sale < minimal),
+                min_price_type & has['price_base'] & (price_base < minimal),
+                min_price_type & has['price_finished_sale'] & (price_finished_sale < minimal),
+                min_price_type & has['price_finished'] & (price_finished < minimal),
+            ]
+        conditions = [rule & validate_data for rule in data_rules]
+        conditions += [rule & validate_price for rule in price_rules]
+        codes = np.select(conditions, list(range(1, len(conditions) + 1)), default=self.OK)
+        # Prices are swapped only if obj data was valid (_validate_obj_data raise before swap)
+        data_ok = ~np.any(np.array(conditions[:len(data_rules)]), axis=0)
+        return codes, swap_base & data_ok, swap_finished & data_ok
+
+    def final_check(self, objects):
+        """
+        Same as calling obj.final_check() for every object, return list of its results
+        """
+        import importlib.util
+
+        objects = list(objects)
+        if importlib.util.find_spec('numpy') is None:
+            return [obj.final_check() for obj in objects]
+        columns = self.collect_columns(objects)
+        codes, swap_base, swap_finished = self.error_codes(columns)
+        results = []
+        for obj, code, base, finished, exact in zip(objects, codes.tolist(), swap_base.tolist(),
+                                                    swap_finished.tolist(), columns['exact']):
+            if code != self.OK or obj._issues or not exact:
+                results.append(obj.final_check())
+                continue
+            if base:
+                obj.price_base, obj.price_sale = obj.price_sale, obj.price_base
+            if finished:
+                obj.price_finished, obj.price_finished_sale = obj.price_finished_sale, obj.price_finished
+            obj._clear_rooms_by_not_flats()
+            obj._set_not_in_sale_if_no_price()
+            obj._swap_base_price_and_finish_price()
+            obj._clear_same_prices()
+            if obj.type not in EstateObject.possible_types:
+                raise Exception('Wrong object type', obj.type)
+            results.append(True)
+        return results
+
+
+class FloorRanges:
+    """
+    Set of floors kept as sorted not overlapping (lo, hi) ranges, e.g. "2-25, 30"
+    is [(2, 25), (30, 30)] instead of 25 ints. Supports `in` (binary search), iteration
+    and len over floors, json as [[lo, hi], ...]
+    """
+    __slots__ = ('ranges', '_starts')
+    _letters = re.compile(r'[а-яА-я]', flags=re.I)
+    _range = re.compile(r'(-?\d+)\s*-\s*(-?\d+)|(-?\d+)')
+
+    def __init__(self, ranges=()):
+        merged = []
+        for lo, hi in sorted(ranges):
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self.ranges = merged
+        self._starts = [lo for lo, _ in merged]
+
+    @classmethod
+    def parse(cls, floors_str):
+        """
+        Floors string like in Utils.split_floors: '2-5' - interval, '2,4,7' - enumeration,
+        both can be used together, ';' and '–' are also separators. Floors can be signed
+        ('-2--1' is [-2, -1], '-1, 1-3' is [-1, 1, 2, 3]). None for empty value
+        """
+        floors_str = str(floors_str).strip() if floors_str is not None else ''
+        if not floors_str:
+            return None
+        return cls(cls.parse_parts(floors_str))
+
+    @classmethod
+    def parse_parts(cls, floors_str):
+        # (lo, hi) of every part of string in its order, reversed intervals are skipped
+        floors_str = cls._letters.sub('', floors_str).replace(';', ',').replace('–', '-')
+        ranges = []
+        for lo, hi, single in cls._range.findall(floors_str):
+            if single:
+                ranges.append((int(single), int(single)))
+            elif int(lo) <= int(hi):
+                ranges.append((int(lo), int(hi)))
+        return ranges
+
+    def __contains__(self, floor):
+        i = bisect.bisect_right(self._starts, floor) - 1
+        return i >= 0 and floor <= self.ranges[i][1]
+
+    def __iter__(self):
+        for lo, hi in self.ranges:
+            yield from range(lo, hi + 1)
+
+    def __len__(self):
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __eq__(self, other):
+        if isinstance(other, FloorRanges):
+            return self.ranges == other.ranges
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self.ranges))
+
+    def __repr__(self):
+        return f'FloorRanges({self.ranges})'
+
+    def to_json(self):
+        return [list(item) for item in self.ranges]
+
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Decimal):
             return float(o)
+        if isinstance(o, FloorRanges):
+            return o.to_json()
         return super(DecimalEncoder, self).default(o)
 
 
+class RetryPolicy:
+    """
+    Retry of page loading: exponential backoff with jitter, Retry-After header,
+    total deadline and split of errors to retryable (network, 429, 5xx) and fatal
+    (other http statuses, bad json, wrong data). Last keep_attempts attempts are saved to
+    `attempts`, stats() has totals of all attempts.
+    Use policy.call(func, ...), await policy.acall(coro_func, ...) or @policy.wrap
+    """
+    retry_statuses = {408, 425, 429, 500, 502, 503, 504}
+    fatal_errors = (ValueError, KeyError, TypeError, AttributeError, IndexError)
+
+    def __init__(self, max_tries=10, base_delay=1, max_delay=30, deadline=120, retry_unknown=True,
+                 keep_attempts=1000):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Seconds for all attempts of one call, None - without limit
+        self.deadline = deadline
+        # Retry exceptions, which are not known as retryable or fatal (old page_reloader behaviour)
+        self.retry_unknown = retry_unknown
+        self.attempts = deque(maxlen=keep_attempts)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _status_of(error):
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None):
+            return response.status_code
+        return getattr(error, 'code', None) if isinstance(error, HTTPError) else None
+
+    def is_retryable(self, error):
+        status = self._status_of(error)
+        if status:
+            return status in self.retry_statuses
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        # requests is loaded already, if its errors could be raised
+        requests = sys.modules.get('requests')
+        if requests is not None and isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, self.fatal_errors):
+            return False
+        return self.retry_unknown
+
+    @staticmethod
+    def _retry_after(error):
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+        value = headers.get('Retry-After')
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return int(value)
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def next_delay(self, try_number, error=None):
+        retry_after = self._retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return retry_after
+        # "Full jitter": random delay up to exponential limit
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** try_number))
+
+    def _record(self, name, try_number, started, error=None):
+        latency = time.monotonic() - started
+        self.attempts.append({'name': name, 'try': try_number, 'latency': latency,
+                              'error': type(error).__name__ if error is not None else None})
+        with self._lock:
+            item = self._stats.setdefault(name, {'attempts': 0, 'retries': 0, 'errors': 0,
+                                                 'total_time': 0.0, 'max_time': 0.0})
+            item['attempts'] += 1
+            item['retries'] += try_number > 0
+            item['errors'] += error is not None
+            item['total_time'] += latency
+            item['max_time'] = max(item['max_time'], latency)
+
+    def _delay_or_raise(self, name, try_number, error, first_started):
+        # Return seconds to wait before next attempt, or raise error if can't retry
+        if not self.is_retryable(error):
+            raise error
+        if try_number + 1 >= self.max_tries:
+            raise Exception(f'Cant reload page after {self.max_tries} retries', name) from error
+        delay = self.next_delay(try_number, error)
+        if self.deadline is not None and time.monotonic() - first_started + delay > self.deadline:
+            raise Exception(f'Cant reload page in {self.deadline} seconds', name) from error
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        name = getattr(func, '__name__', str(func))
+        first_started = time.monotonic()
+        for try_number in range(self.max_tries):
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._record(name, try_number, started, e)
+                time.sleep(self._delay_or_raise(name, try_number, e, first_started))
+            else:
+                self._record(name, try_number, started)
+                return result
+
+    async def acall(self, func, *args, **kwargs):
+        import asyncio
+
+        name = getattr(func, '__name__', str(func))
+        first_started = time.monotonic()
+        for try_number in range(self.max_tries):
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self._record(name, try_number, started, e)
+                await asyncio.sleep(self._delay_or_raise(name, try_number, e, first_started))
+            else:
+                self._record(name, try_number, started)
+                return result
+
+    def wrap(self, func):
+        import inspect
+
+        if inspect.iscoroutinefunction(func):
+            async def async_wrapper(*args, **kwargs):
+                return await self.acall(func, *args, **kwargs)
+            return async_wrapper
+
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        """
+        Attempts summary by function name: calls, retries, errors and time of all attempts
+        """
+        with self._lock:
+            return {name: dict(item) for name, item in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self.attempts.clear()
+            self._stats = {}
+
+
+_pooled_session_class = None
+
+
+def pooled_session_class():
+    """
+    Return PooledSession: requests.Session with default timeout for every request.
+    Class is created on first call, so requests is not imported with this module
+    """
+    global _pooled_session_class
+    if _pooled_session_class is None:
+        import requests
+
+        class PooledSession(requests.Session):
+
+            def __init__(self, timeout=None):
+                super().__init__()
+                self.timeout = timeout
+
+            def request(self, method, url, **kwargs):
+                if kwargs.get('timeout') is None:
+                    kwargs['timeout'] = self.timeout
+                return super().request(method, url, **kwargs)
+
+        _pooled_session_class = PooledSession
+    return _pooled_session_class
+
+
+class HTTP2Session:
+    """
+    Minimal session interface (get, headers, close) over httpx.Client with http2.
+    verify is option of client in httpx, not of request: it is set by Transport(verify=...),
+    get with other verify raises
+    """
+
+    def __init__(self, client, verify=True):
+        self.client = client
+        self.headers = client.headers
+        self.verify = verify
+
+    def get(self, url, **kwargs):
+        verify = kwargs.pop('verify', None)
+        if verify is not None and verify != self.verify:
+            raise Exception('verify of http2 session is set by Transport, request has other value', verify)
+        if kwargs.get('timeout') is None:
+            kwargs.pop('timeout', None)
+        return self.client.get(url, **kwargs)
+
+    def close(self):
+        self.client.close()
+
+
+class Transport:
+    """
+    Settings of http connections: pool size, connect/read timeouts, keep-alive, compression,
+    ssl verify and optional http2 (needs httpx[http2]). One Transport (and its pooled
+    session) can be shared by several parsers in one process.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, connect_timeout=10, read_timeout=60,
+                 verify=True, http2=False, headers=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.verify = verify
+        self.http2 = http2
+        self.headers = headers or {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def accept_encoding():
+        # br can be decoded only with brotli package
+        for module in ('brotli', 'brotlicffi'):
+            try:
+                __import__(module)
+                return 'gzip, deflate, br'
+            except ImportError:
+                pass
+        return 'gzip, deflate'
+
+    def _default_headers(self):
+        headers = {'Accept-Encoding': self.accept_encoding(), 'Connection': 'keep-alive'}
+        headers.update(self.headers)
+        return headers
+
+    def _make_requests_session(self):
+        from requests.adapters import HTTPAdapter
+
+        if not self.verify:
+            import urllib3
+            urllib3.disable_warnings()
+        session = pooled_session_class()(timeout=(self.connect_timeout, self.read_timeout))
+        # pool_block: concurrent requests wait for free connection instead of opening not pooled ones
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.verify = self.verify
+        session.headers.update(self._default_headers())
+        return session
+
+    def _make_http2_session(self):
+        try:
+            import httpx
+        except ImportError:
+            raise Exception('http2 transport needs httpx package: pip install httpx[http2]')
+        client = httpx.Client(
+            http2=True, verify=self.verify, headers=self._default_headers(),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_maxsize,
+                                max_keepalive_connections=self.pool_maxsize))
+        return HTTP2Session(client, self.verify)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_http2_session() if self.http2 else self._make_requests_session()
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class ResponseCache:
+    """
+    Loaded json by (url, params) for one run, can be shared by several parsers
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        with self._lock:
+            if key in self._data:
+                return self._data[key]
+        value = load()
+        with self._lock:
+            return self._data.setdefault(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit of in-flight requests to one site. While latency is near its baseline
+    (smoothed latency of responses without overload and latency spikes) limit grows by 1 per `limit` responses, on
+    429/5xx, network error or latency > baseline * latency_tolerance it is cut to
+    limit * backoff (only by requests sent after the last cut, so one burst is one cut).
+    Requests wait in acquire() while limit is reached, so pools of workers should have
+    max_limit threads. Every change is saved to `decisions` and to metrics
+    (concurrency_limit, concurrency_in_flight gauges, concurrency_increase,
+    concurrency_decrease_error, concurrency_decrease_latency counters, concurrency_wait timer).
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, backoff=0.5, latency_tolerance=2.0,
+                 smoothing=0.1, metrics=None):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.metrics = metrics or NullMetrics()
+        self.baseline = None
+        self.in_flight = 0
+        self.decisions = []
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        # Waiting requests get place in order of acquire (tickets), no thread waits forever
+        self._next_ticket = 0
+        self._turn = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._turn or self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self._turn += 1
+            self.in_flight += 1
+            in_flight = self.in_flight
+            self._condition.notify_all()
+        self.metrics.observe('concurrency_wait', time.monotonic() - started)
+        self.metrics.gauge('concurrency_in_flight', in_flight)
+
+    def _is_overload(self, status, error):
+        if error is not None:
+            return RetryPolicy().is_retryable(error)
+        return status == 429 or status is not None and status >= 500
+
+    def release(self, latency, status=None, error=None):
+        """
+        Finish of request: latency in seconds and status of response or error
+        """
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            old_limit = self.limit
+            reason = None
+            if self._is_overload(status, error):
+                reason = 'error'
+            elif self.baseline is not None and latency > self.baseline * self.latency_tolerance:
+                reason = 'latency'
+            # Baseline is latency of normal responses: overloads and spikes don't move it,
+            # spikes at min_limit do (site is slower now, not overloaded by us)
+            normal = reason is None or reason == 'latency' and old_limit <= self.min_limit
+            if reason:
+                # Responses of requests, sent before the last cut, don't cut limit again
+                if now - latency > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                else:
+                    reason = None
+            elif error is None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if normal:
+                self.baseline = latency if self.baseline is None else \
+                    self.baseline + self.smoothing * (latency - self.baseline)
+            increased = int(self.limit) > int(old_limit)
+            if reason or increased:
+                self.decisions.append({'time': now, 'reason': reason or 'increase', 'limit': int(self.limit),
+                                       'latency': latency, 'status': status})
+            self._condition.notify_all()
+        if reason:
+            self.metrics.incr('concurrency_decrease_' + reason)
+        elif increased:
+            self.metrics.incr('concurrency_increase')
+        self.metrics.gauge('concurrency_limit', int(self.limit))
+
+
+class ThrottledSession:
+    """
+    Session wrapper, every get waits for free place in AdaptiveConcurrency and reports
+    latency and status to it
+    """
+
+    def __init__(self, session, controller):
+        self.session = session
+        self.controller = controller
+
+    def get(self, url, **kwargs):
+        self.controller.acquire()
+        started = time.monotonic()
+        try:
+            response = self.session.get(url, **kwargs)
+        except Exception as e:
+            self.controller.release(time.monotonic() - started, error=e)
+            raise
+        self.controller.release(time.monotonic() - started, status=response.status_code)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class CountingSession:
+    """
+    Session wrapper, which counts every get sent to site: retries, failed requests,
+    non-json responses and plan images too (metrics count only loaded json)
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return self.session.get(url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class ResponseLog:
+    """
+    Append-only log of raw http responses for record/replay. Record in log file is
+    [4 bytes meta length][8 bytes body length][meta json][body], meta has url, params,
+    conditions (If-None-Match/If-Modified-Since of request), status, headers, elapsed and
+    recorded_at. Conditions are part of the key, so conditional get replays the recorded
+    304 and not the 200 of plain get. Sidecar `path.idx` (json lines) keeps
+    key and offset of every record, so replay finds responses without reading the log,
+    log itself is memory-mapped.
+    """
+    header = struct.Struct('<IQ')
+    conditional_headers = ('if-none-match', 'if-modified-since')
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._lock = threading.Lock()
+        self._map = None
+        self._index = None
+
+    @classmethod
+    def conditions(cls, headers):
+        return {name.lower(): value for name, value in (headers or {}).items()
+                if name.lower() in cls.conditional_headers and value} or None
+
+    @staticmethod
+    def key(url, params=None, conditions=None):
+        key = url + '?' + json.dumps(params, sort_keys=True, ensure_ascii=False, default=str) if params else url
+        if conditions:
+            key += '#' + json.dumps(conditions, sort_keys=True, ensure_ascii=False)
+        return key
+
+    def append(self, url, params, response, elapsed, headers=None):
+        body = response.content
+        conditions = self.conditions(headers)
+        meta = json.dumps({'url': url, 'params': params, 'conditions': conditions, 'status': response.status_code,
+                           'headers': dict(response.headers), 'elapsed': round(elapsed, 6),
+                           'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S')},
+                          ensure_ascii=False, default=str).encode('utf-8')
+        with self._lock:
+            with open(self.path, 'ab') as log:
+                offset = log.tell()
+                log.write(self.header.pack(len(meta), len(body)))
+                log.write(meta)
+                log.write(body)
+            key = self.key(url, params, conditions)
+            with open(self.index_path, 'a', encoding='utf-8') as index:
+                index.write(json.dumps({'key': key, 'offset': offset}, ensure_ascii=False) + '\n')
+            # Map of log is remapped on next read (readers keep old one until they finish)
+            self._map = None
+            if self._index is not None:
+                self._index.setdefault(key, []).append(offset)
+
+    def _mapped(self):
+        if self._map is None:
+            import mmap
+
+            with open(self.path, 'rb') as log:
+                self._map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def read(self, offset):
+        data = self._mapped()
+        meta_length, body_length = self.header.unpack_from(data, offset)
+        start = offset + self.header.size
+        meta = json.loads(data[start:start + meta_length])
+        body = data[start + meta_length:start + meta_length + body_length]
+        return meta, body
+
+    def offsets(self):
+        # Record offsets by scanning log, used if index is lost
+        data = self._mapped()
+        offset = 0
+        while offset < len(data):
+            yield offset
+            meta_length, body_length = self.header.unpack_from(data, offset)
+            offset += self.header.size + meta_length + body_length
+
+    def rebuild_index(self):
+        with open(self.index_path, 'w', encoding='utf-8') as index:
+            for offset in self.offsets():
+                meta, _ = self.read(offset)
+                index.write(json.dumps({'key': self.key(meta['url'], meta['params'], meta.get('conditions')),
+                                        'offset': offset},
+                                       ensure_ascii=False) + '\n')
+        self._index = None
+
+    def index(self):
+        """
+        key -> offsets of its records in order of recording
+        """
+        if self._index is None:
+            if not os.path.exists(self.index_path):
+                self.rebuild_index()
+            index = {}
+            with open(self.index_path, encoding='utf-8') as lines:
+                for line in lines:
+                    item = json.loads(line)
+                    index.setdefault(item['key'], []).append(item['offset'])
+            self._index = index
+        return self._index
+
+    def records(self):
+        # All (meta, body) in order of recording, e.g. to re-run extraction over history
+        for offset in self.offsets():
+            yield self.read(offset)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class RecordedResponse:
+    """
+    Response from ResponseLog with the same interface as requests response
+    """
+
+    def __init__(self, meta, body):
+        self.url = meta['url']
+        self.status_code = meta['status']
+        self.headers = meta['headers']
+        self.elapsed_seconds = meta['elapsed']
+        self.content = body
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(self.url, self.status_code, 'Recorded response', self.headers, None)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class RecordingSession:
+    """
+    Session wrapper, which writes every response of get to ResponseLog
+    """
+
+    def __init__(self, session, log):
+        self.session = session
+        self.log = log
+
+    def get(self, url, params=None, **kwargs):
+        started = time.monotonic()
+        response = self.session.get(url, params=params, **kwargs)
+        self.log.append(url, params, response, time.monotonic() - started, kwargs.get('headers'))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class ReplaySession:
+    """
+    Session without network: get returns recorded responses of the same url, params and
+    conditional headers in order of recording, after the last one it is returned again
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.headers = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, **kwargs):
+        key = self.log.key(url, params, self.log.conditions(kwargs.get('headers')))
+        offsets = self.log.index().get(key)
+        if not offsets:
+            raise Exception('No recorded response for', key)
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return RecordedResponse(*self.log.read(offsets[min(position, len(offsets) - 1)]))
+
+    def close(self):
+        self.log.close()
+
+
+class PlanDownloader:
+    """
+    Download of plan images to content-addressed local store: file of image is
+    directory/ab/abcdef...png (sha256 of content), so layout shared by many lots is saved
+    once. Urls are loaded once per run (by bounded thread pool), directory/index.json keeps
+    ETag/Last-Modified of every url, so unchanged images are not loaded again (304).
+    attach(records) adds plan_hash and plan_path to every record with plan.
+    """
+
+    def __init__(self, directory, workers=8, field='plan'):
+        self.directory = directory
+        self.workers = workers
+        self.field = field
+        self.index_path = os.path.join(directory, 'index.json')
+        self._index = None
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.index(), ensure_ascii=False, indent=1)
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _store(self, content, url):
+        import hashlib
+
+        digest = hashlib.sha256(content).hexdigest()
+        extension = os.path.splitext(urlparse(url).path)[1].lower()[:8]
+        path = os.path.join(self.directory, digest[:2], digest + extension)
+        if os.path.exists(path):
+            self._count('same_content')
+            return digest, path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to temp file, so other thread or run never see half of image
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        self._count('saved')
+        return digest, path
+
+    def _load(self, url, session, retry_policy):
+        with self._lock:
+            known = self.index().get(url)
+        headers = {}
+        if known and os.path.exists(known['path']):
+            if known.get('etag'):
+                headers['If-None-Match'] = known['etag']
+            if known.get('last_modified'):
+                headers['If-Modified-Since'] = known['last_modified']
+
+        def get():
+            response = session.get(url, headers=headers)
+            try:
+                if response.status_code == 304:
+                    return None, response.headers
+                response.raise_for_status()
+                return response.content, response.headers
+            finally:
+                response.close()
+
+        content, response_headers = retry_policy.call(get) if retry_policy else get()
+        if content is None:
+            self._count('not_modified')
+            return known
+        self._count('downloaded')
+        digest, path = self._store(content, url)
+        entry = {'hash': digest, 'path': path, 'etag': response_headers.get('ETag'),
+                 'last_modified': response_headers.get('Last-Modified')}
+        with self._lock:
+            self.index()[url] = entry
+        return entry
+
+    def download(self, url, session, retry_policy=None):
+        """
+        Return index entry (hash, path, etag, last_modified) of url, every url is loaded
+        once per run, threads with the same url wait for the first one
+        """
+        from concurrent.futures import Future
+
+        with self._lock:
+            future = self._loaded.get(url)
+            owner = future is None
+            if owner:
+                future = self._loaded[url] = Future()
+        if not owner:
+            self._count('same_url')
+            return future.result()
+        try:
+            future.set_result(self._load(url, session, retry_policy))
+        except Exception as e:
+            self._count('failed')
+            logger.warning(f'Plan {url} is not loaded: {e!r}')
+            future.set_exception(e)
+        return future.result()
+
+    def attach_one(self, record, session, retry_policy=None):
+        url = record.get(self.field)
+        if not url:
+            return record
+        try:
+            entry = self.download(url, session, retry_policy)
+        except Exception:
+            # Lot is saved without image, url is not loaded again in this run
+            entry = None
+        record['plan_hash'] = entry['hash'] if entry else None
+        record['plan_path'] = entry['path'] if entry else None
+        return record
+
+    def attach(self, records, session, retry_policy=None, workers=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        urls = list(dict.fromkeys(record[self.field] for record in records if record.get(self.field)))
+        with ThreadPoolExecutor(max_workers=workers or self.workers) as pool:
+            for url in urls:
+                pool.submit(self.attach_one, {self.field: url}, session, retry_policy)
+        for record in records:
+            self.attach_one(record, session, retry_policy)
+        self.save_index()
+        return records
+
+
 class Utils:
 
     @staticmethod
@@ -781,6 +1850,12 @@ class Utils:
                 value = re.sub(part, '', value, flags=re.I).strip()
         return value
 
+    @staticmethod
+    def is_tag(value):
+        # Value can be bs4 Tag only if bs4 was imported by parser, so don't import it here
+        bs4 = sys.modules.get('bs4')
+        return bs4 is not None and isinstance(value, bs4.Tag)
+
     @staticmethod
     def _normalize_str(string):
         return ' '.join(re.sub(r'\s', ' ', string).strip().split())
@@ -811,17 +1886,37 @@ class Utils:
 
     @staticmethod
     def page_reloader(func):
-        def wrapper(*args, **kwargs):
-            try_number = 0
-            while try_number < 10:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    # print(e)
-                    time.sleep(1 + try_number)
-            raise Exception('Cant reload page after 10 retries')
+        # Kept for old parsers, see RetryPolicy for settings
+        return RetryPolicy().wrap(func)
 
-        return wrapper
+    @staticmethod
+    def record_key(record):
+        """
+        Canonical string of pre_json record (keys are strings) for dedup: equal records (by ==,
+        so key order doesn't matter and 1 == 1.0 == True == Decimal('1.00')) have equal keys,
+        not equal records (e.g. Decimals which differ beyond float precision) have different keys
+        """
+        return json.dumps(Utils._canonical(record), ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def _canonical(value):
+        # Containers and numbers are tagged lists, so they don't match strings or each other
+        if value is None or isinstance(value, str):
+            return value
+        if type(value) is int:
+            return ['n', str(value)]
+        if isinstance(value, dict):
+            return ['d', sorted([str(k), Utils._canonical(v)] for k, v in value.items())]
+        if isinstance(value, (list, tuple, FloorRanges)):
+            # FloorRanges == list of its floors, tuple != list
+            return ['t' if isinstance(value, tuple) else 'l', [Utils._canonical(item) for item in value]]
+        if isinstance(value, (int, float, Decimal)):
+            # Exact digits without trailing zeros (Decimal of float is exact, format 'f' is not rounded)
+            text = format(Decimal(value), 'f')
+            if '.' in text:
+                text = text.rstrip('0').rstrip('.')
+            return ['n', '0' if text == '-0' else text]
+        return ['o', type(value).__name__, repr(value)]
 
     @staticmethod
     def split_floors(floors_str):
@@ -829,26 +1924,70 @@ class Utils:
         Split floor string to floors array. Assume that floors are separated
         by '-' if interval (e.g. 2-5 return [2,3,4,5]) and with ',' as enumeration
         (e.g. '2,4,7' return [2,4,7]). Both separators can be used together.
+        Use FloorRanges.parse to keep big intervals without expanding them.
         """
-        floors = []
         floors_str = floors_str.strip()
         if floors_str:
-            floors_str = re.sub(r'[а-яА-я]', '', floors_str, flags=re.I)
-            floors_str = floors_str.replace(';', ',').replace('–', '-')
-            if floors_str:
-                if '-' in floors_str and ',' in floors_str:
-                    for floor in floors_str.split(','):
-                        floors.extend(Utils.split_floors(floor))
-                elif '-' in floors_str:
-                    from_floor, to_floor = floors_str.split('-')
-                    for floor in range(int(from_floor), int(to_floor) + 1):
-                        floors.append(floor)
-                elif ',' in floors_str:
-                    floors = [int(floor) for floor in floors_str.split(',') if floor]
-                else:
-                    floors.append(int(floors_str))
+            floors = []
+            # One pass by compiled regex, order and repeats are the same as in string
+            for lo, hi in FloorRanges.parse_parts(floors_str):
+                floors.extend(range(lo, hi + 1))
             return floors
 
+    # Strings (with escapes), comments and brackets - everything else is skipped by re in C
+    _js_token = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|`(?:[^`\\]|\\.)*`'
+                           r'|/\*.*?\*/|//[^\r\n]*|[{}\[\];\n]', re.DOTALL)
+
+    @staticmethod
+    def js_literal(text, start=0):
+        """
+        Return source of js literal which begins at `start` (after spaces, '=' and ':').
+        Objects and arrays are balanced by brackets, strings and comments are respected,
+        so ';' or '}' inside strings does not break literal. Comments inside literal are removed.
+        """
+        length = len(text)
+        while start < length and text[start] in ' \t\r\n=:':
+            start += 1
+        if start >= length:
+            raise Exception('No js literal found after position', start)
+        nested = text[start] in '{['
+        depth = 0
+        parts = []
+        part_start = start
+        for match in Utils._js_token.finditer(text, start):
+            token = match.group()
+            first = token[0]
+            if first == '/' and len(token) > 1 and token[1] in '/*':
+                parts.append(text[part_start:match.start()])
+                part_start = match.end()
+            elif first in '{[':
+                depth += 1
+            elif first in '}]':
+                depth -= 1
+                if nested and depth == 0:
+                    parts.append(text[part_start:match.end()])
+                    return ''.join(parts)
+            elif first in ';\n' and not nested:
+                parts.append(text[part_start:match.start()])
+                return ''.join(parts).strip()
+        if nested:
+            raise Exception('Unbalanced js literal from position', start)
+        parts.append(text[part_start:])
+        return ''.join(parts).strip()
+
+    @staticmethod
+    def _find_js_var(text, var_name):
+        # End of first match of var_name (regex, as in old extract_js), which is not inside of js comment or string
+        tokens = Utils._js_token.finditer(text)
+        token = next(tokens, None)
+        for match in re.finditer(var_name, text):
+            position = match.start()
+            while token is not None and token.end() <= position:
+                token = next(tokens, None)
+            if token is None or not (token.start() < position and token.group()[0] in '"\'`/'):
+                return match.end()
+        return -1
+
     @staticmethod
     def extract_js(var_name, bs=None, text=None):
         if bs:
@@ -857,27 +1996,20 @@ class Utils:
             script = re.findall(var_name + r'(.*?);', script)[0]
             return json.dumps(script)
         if text:
-            text = Utils.remove_comments(text)
-            text = text.strip().replace('\n', '')
-            pre_js = re.findall(var_name + r'(.*?);', text)[0]
-            return json.loads(pre_js)
+            position = Utils._find_js_var(text, var_name)
+            if position == -1:
+                raise Exception('Variable not found in js', var_name)
+            return json.loads(Utils.js_literal(text, position))
 
     @staticmethod
     def remove_comments(string):
-        # Stackoverflow solution for removing comment from js code
-        pattern = r"(\".*?\"|\'.*?\')|(/\*.*?\*/|//[^\r\n]*$)"
-        # first group captures quoted strings (double or single)
-        # second group captures comments (//single-line or /* multi-line */)
-        regex = re.compile(pattern, re.MULTILINE | re.DOTALL)
-
+        # Removing comments from js code, quoted strings (with escaped quotes) are kept as is
         def _replacer(match):
-            # if the 2nd group (capturing comments) is not None,
-            # it means we have captured a non-quoted (real) comment string.
-            if match.group(2) is not None:
-                return ""  # so we will return empty to remove the comment
-            else:  # otherwise, we will return the 1st group
-                return match.group(1)  # captured quoted-string
-        return regex.sub(_replacer, string)
+            token = match.group()
+            if token[0] == '/' and len(token) > 1 and token[1] in '/*':
+                return ''
+            return token
+        return Utils._js_token.sub(_replacer, string)
 
     @staticmethod
     def test_out(data, file='Setun.txt'):
@@ -960,7 +2092,7 @@ class TableMapper:
 
     @staticmethod
     def _clean_key(key, exact_match):
-        if key and isinstance(key, Tag):
+        if key and Utils.is_tag(key):
             key = key.get_text(separator=" ").strip()
         key = Utils._normalize_str(key)
         restricted = [',', 'м²', 'м2', 'кв.м.', 'кв.м']
@@ -970,7 +2102,7 @@ class TableMapper:
 
     @staticmethod
     def _clean_value(value):
-        if value and isinstance(value, Tag):
+        if value and Utils.is_tag(value):
             value = value.get_text(separator=" ").strip()
         if isinstance(value, str):
             value = Utils._normalize_str(value)
@@ -1050,73 +2182,1254 @@ class TableMapper:
             yield row, head
 
 
-class BaseParser:
+class SetterProfiler:
+    """
+    Opt-in profiling of EstateObject.set_* methods and TableMapper dispatch: calls count,
+    cumulative time (with nested setters) and exceptions count. enable() replaces methods
+    of classes by wrappers, disable() returns original methods, so when profiling is off
+    there is no overhead at all. Methods are patched for the whole process, so parsers
+    running in other threads at the same time are counted too.
+    """
+    stats = {}
+    _originals = []
+    _lock = threading.Lock()
+    mapper_methods = ['map_by_one', '_map_key_to_method']
+
+    @classmethod
+    def is_active(cls):
+        return bool(cls._originals)
+
+    @classmethod
+    def _wrap(cls, name, func):
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                spent = perf_counter() - started
+                with cls._lock:
+                    item = cls.stats.setdefault(name, [0, 0.0, 0])
+                    item[0] += 1
+                    item[1] += spent
+                    item[2] += failed
+        return wrapper
+
+    @classmethod
+    def enable(cls, object_classes=None):
+        if cls.is_active():
+            return
+        patches = []
+        for klass in object_classes or [EstateObject]:
+            patches.extend((klass, name) for name, attr in vars(klass).items()
+                           if name.startswith('set_') and callable(attr))
+        patches.extend((TableMapper, name) for name in cls.mapper_methods)
+        for klass, name in patches:
+            original = vars(klass)[name]
+            cls._originals.append((klass, name, original))
+            setattr(klass, name, cls._wrap(f'{klass.__name__}.{name}', original))
+
+    @classmethod
+    def disable(cls):
+        for klass, name, original in reversed(cls._originals):
+            setattr(klass, name, original)
+        cls._originals = []
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.stats = {}
+
+    @classmethod
+    def take(cls):
+        # Return stats and start new ones (stats of worker process chunk)
+        with cls._lock:
+            stats, cls.stats = cls.stats, {}
+        return stats
+
+    @classmethod
+    def merge(cls, stats):
+        with cls._lock:
+            for name, (calls, total, errors) in stats.items():
+                item = cls.stats.setdefault(name, [0, 0.0, 0])
+                item[0] += calls
+                item[1] += total
+                item[2] += errors
+
+    @classmethod
+    def table(cls):
+        """
+        Hot path table: methods sorted by cumulative time
+        """
+        lines = [f'{"method":<40}{"calls":>10}{"total ms":>12}{"us/call":>10}{"errors":>8}']
+        with cls._lock:
+            rows = sorted(cls.stats.items(), key=lambda x: -x[1][1])
+        for name, (calls, total, errors) in rows:
+            lines.append(f'{name:<40}{calls:>10}{total * 1000:>12.2f}{total / calls * 1e6:>10.1f}{errors:>8}')
+        return '\n'.join(lines)
+
+    @classmethod
+    def print_table(cls, file=None):
+        # stderr by default: stdout is used for json result
+        print(cls.table(), file=file or sys.stderr)
+
+
+class StagedPipeline:
+    """
+    Chain of stages connected by bounded queues. Each stage is (name, func, workers),
+    func(item, put) handles one item and calls put(result) for every item of the next stage.
+    Full queue blocks previous stage (backpressure), so memory does not grow when one stage is slow.
+    With several workers in stage the order of items is not kept.
+    """
+    _stop = object()
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self.stages = []
+        self.error = None
+
+    def add_stage(self, name, func, workers=1):
+        self.stages.append((name, func, max(1, workers)))
+        return self
+
+    def _worker(self, func, in_queue, out_queue, finished, next_workers):
+        put = out_queue.put if out_queue is not None else (lambda item: None)
+        while True:
+            item = in_queue.get()
+            if item is self._stop:
+                break
+            if self.error is not None:
+                # Only drain queue, so previous stages are not blocked forever
+                continue
+            try:
+                func(item, put)
+            except BaseException as e:
+                self.error = e
+        with finished['lock']:
+            finished['count'] -= 1
+            last = finished['count'] == 0
+        if last and out_queue is not None:
+            for _ in range(next_workers):
+                out_queue.put(self._stop)
+
+    def run(self, items):
+        if not self.stages:
+            return
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = []
+        for i, (name, func, workers) in enumerate(self.stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            next_workers = self.stages[i + 1][2] if out_queue is not None else 0
+            finished = {'lock': threading.Lock(), 'count': workers}
+            for n in range(workers):
+                thread = threading.Thread(target=self._worker, name=f'{name}-{n}', daemon=True,
+                                          args=(func, queues[i], out_queue, finished, next_workers))
+                thread.start()
+                threads.append(thread)
+        try:
+            for item in items:
+                if self.error is not None:
+                    break
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0][2]):
+                queues[0].put(self._stop)
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class JSONStreamOutput:
+    """
+    Write records as one json list while they come. Set of written records is the same as
+    in BaseParser.output_result (dedup by Utils.record_key), order is the order of write,
+    which differs from loaded_objects with several extract or check workers
+    """
+
+    def __init__(self, stream=None, prefix=''):
+        import hashlib
+
+        self.stream = stream or sys.stdout
+        self.prefix = prefix
+        # 16 bytes digest of record_key of every written record, so memory of dedup is small
+        self._digest = lambda record: hashlib.blake2b(Utils.record_key(record).encode('utf-8'),
+                                                      digest_size=16).digest()
+        self._seen = set()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        digest = self._digest(record)
+        with self._lock:
+            if digest in self._seen:
+                return
+            text = json.dumps(record, cls=DecimalEncoder, indent=1, sort_keys=False)
+            self._seen.add(digest)
+            self.stream.write(self.prefix + '[\n ' if not self._count else ',\n ')
+            self.stream.write(text.replace('\n', '\n '))
+            self._count += 1
+
+    def close(self, end='\n'):
+        self.stream.write('\n]' + end if self._count else self.prefix + '[]' + end)
+        self.stream.flush()
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics:
+    """
+    Metrics which do nothing, default for BaseParser (no overhead without metrics)
+    """
+    enabled = False
+    _timer = _NullTimer()
+
+    def incr(self, name, value=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def timer(self, name):
+        return self._timer
+
+    def merge(self, snapshot):
+        pass
+
+    def as_dict(self):
+        return {'counters': {}, 'timers': {}, 'gauges': {}}
+
+
+class _Timer:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class StatsdFileSink:
+    """
+    Write every metric event as statsd line (`name:1|c`, `name:12.5|ms`) to local file
+    """
+
+    def __init__(self, path, prefix='parser.'):
+        self.prefix = prefix
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def counter(self, name, value):
+        with self._lock:
+            self._file.write(f'{self.prefix}{name}:{value}|c\n')
+
+    def timing(self, name, seconds):
+        with self._lock:
+            self._file.write(f'{self.prefix}{name}:{seconds * 1000:.3f}|ms\n')
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._file.write(f'{self.prefix}{name}:{value}|g\n')
+
+    def close(self):
+        self._file.close()
 
-    def __init__(self, url_base=None, complex_name=None):
+
+class Metrics:
+    """
+    Counters and timers of parser stages: http, http_bytes, json_decode, extract_data,
+    final_check, dedup, serialize, lots_saved, lots_skipped, lots_failed ...
+    and gauges (last value, e.g. concurrency_limit).
+    Export by as_dict(), to_prometheus() or sink (e.g. StatsdFileSink) for every event
+    """
+    enabled = True
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.counters = Counter()
+        # name -> [count, total seconds, max seconds]
+        self.timers = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+        if self.sink:
+            self.sink.counter(name, value)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        if self.sink:
+            self.sink.timing(name, seconds)
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+        if self.sink:
+            self.sink.gauge(name, value)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def merge(self, snapshot):
+        # Add as_dict() of other Metrics (e.g. from worker process)
+        with self._lock:
+            self.counters.update(snapshot['counters'])
+            self.gauges.update(snapshot.get('gauges', {}))
+            for name, item in snapshot['timers'].items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += item['count']
+                timer[1] += item['total']
+                timer[2] = max(timer[2], item['max'])
+
+    def as_dict(self):
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timers': {name: {'count': count, 'total': total, 'max': max_}
+                               for name, (count, total, max_) in self.timers.items()},
+                    'gauges': dict(self.gauges)}
+
+    def to_prometheus(self, prefix='parser_'):
+        lines = []
+        data = self.as_dict()
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f'# TYPE {prefix}{name}_total counter')
+            lines.append(f'{prefix}{name}_total {value}')
+        for name, item in sorted(data['timers'].items()):
+            lines.append(f'# TYPE {prefix}{name}_seconds summary')
+            lines.append(f'{prefix}{name}_seconds_count {item["count"]}')
+            lines.append(f'{prefix}{name}_seconds_sum {item["total"]:.6f}')
+        for name, value in sorted(data['gauges'].items()):
+            lines.append(f'# TYPE {prefix}{name} gauge')
+            lines.append(f'{prefix}{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Parser instance of worker process, created once by pool initializer and reused for all chunks
+_extract_parser = None
+
+
+def _init_extract_worker(parser_class, init_args, init_kwargs, object_options, metrics_enabled):
+    global _extract_parser
+    _extract_parser = parser_class(*init_args, **init_kwargs)
+    # Skipped kwargs are filtered by name only, positional extract_workers must not start pool in worker
+    _extract_parser.extract_workers = 0
+    _extract_parser.object_options = object_options
+    _extract_parser.metrics = Metrics() if metrics_enabled else NullMetrics()
+
+
+def _extract_chunk(chunk):
+    _extract_parser.loaded_objects = []
+    _extract_parser.reset_quality()
+    if _extract_parser.metrics.enabled:
+        _extract_parser.metrics = Metrics()
+    _extract_parser.extract_many(chunk)
+    return (_extract_parser.loaded_objects, _extract_parser.quality_report(),
+            _extract_parser.metrics.as_dict(), SetterProfiler.take())
+
+
+class BaseParser:
+    # Constructor kwargs, which are not passed to extract worker processes (network, shared objects, pool)
+    worker_skipped_kwargs = ['transport', 'cache', 'metrics', 'concurrency', 'capture', 'replay', 'plan_dir',
+                             'extract_workers', 'extract_chunk_size']
+
+    def __new__(cls, *args, **kwargs):
+        # Constructor arguments are kept to create the same parser in extract worker processes
+        parser = super().__new__(cls)
+        parser.init_args = (args, kwargs)
+        return parser
+
+    def __init__(self, url_base=None, complex_name=None, extract_workers=0, extract_chunk_size=500,
+                 collect_issues=False, transport=None, cache=None, metrics=None, profile_setters=False,
+                 capture=None, replay=None, intern_strings=False, plan_dir=None, concurrency=None):
         self.url_base = url_base
         self.complex_name = complex_name
         self.loaded_objects = []
         self.preloaded_objects = []
-        self.session = requests.Session()
+        # Transport can be shared between parsers, session is created by it on first request
+        self.transport = transport or Transport()
+        self._session = None
+        # capture: path of ResponseLog to record all responses, replay: path of log to use instead of network
+        self.capture_log = ResponseLog(capture) if capture else None
+        if replay:
+            self._session = ReplaySession(ResponseLog(replay))
+        # ResponseCache, if set the same url with the same params is loaded once
+        self.cache = cache
+        # Metrics() to count and time stages, by default NullMetrics (nothing is saved)
+        self.metrics = metrics or NullMetrics()
+        # AdaptiveConcurrency of site, all requests of session wait for its limit
+        self.concurrency = concurrency
+        if concurrency is not None and not concurrency.metrics.enabled:
+            concurrency.metrics = self.metrics
+        # Hot path table of set_* methods is printed by output_result, then profiling is stopped
+        self.profile_setters = profile_setters
+        if profile_setters:
+            self._enable_profiler()
         self.loaded_links = []
         # After need_stop=True no more object will be saved
         self.need_stop = False
         self.mapper = TableMapper()
+        self.retry_policy = RetryPolicy()
+        # With extract_workers > 0 extract_many run extract_data + final_check in process pool
+        self.extract_workers = extract_workers
+        self.extract_chunk_size = extract_chunk_size
+        self._extract_pool = None
+        # convert_do_dict check all preloaded objects by one BatchValidator call
+        self.batch_validation = False
+        # Passed to every EstateObject, with collect_issues bad lots don't raise in setters
+        self.collect_issues = collect_issues
+        self.object_options = {'_collect_issues': True} if collect_issues else {}
+        # One InternTable for all lots of run (loaded_objects), see InternTable
+        self.intern_table = InternTable() if intern_strings else None
+        if intern_strings:
+            self.object_options['_intern_table'] = self.intern_table
+        # Directory of plan images, see download_plans and PlanDownloader
+        self.plan_downloader = PlanDownloader(plan_dir) if plan_dir else None
+        self._quality_lock = threading.Lock()
+        self.reset_quality()
+        # Set in extract threads of run_pipeline, save_JS_obj send objects to check stage
+        self._pipeline_local = threading.local()
+
+    @property
+    def session(self):
+        if self._session is None:
+            if self.capture_log is None and self.concurrency is None:
+                return self.transport.session
+            session = self.transport.session
+            if self.capture_log is not None:
+                session = RecordingSession(session, self.capture_log)
+            if self.concurrency is not None:
+                session = ThrottledSession(session, self.concurrency)
+            self._session = session
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        self._session = value
+
+    def _enable_profiler(self):
+        if not SetterProfiler.is_active():
+            SetterProfiler.reset()
+        SetterProfiler.enable()
+
+    def _get_extract_pool(self):
+        # Pool is kept between calls, so workers startup is paid once per run (not per category)
+        if self._extract_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            args, kwargs = self.init_args
+            kwargs = {name: value for name, value in kwargs.items() if name not in self.worker_skipped_kwargs}
+            self._extract_pool = ProcessPoolExecutor(
+                max_workers=self.extract_workers, initializer=_init_extract_worker,
+                initargs=(type(self), args, kwargs, self.object_options, self.metrics.enabled))
+        return self._extract_pool
+
+    def close_extract_pool(self):
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown()
+            self._extract_pool = None
+
+    def extract_many(self, items):
+        """
+        Call extract_data for every raw item. If extract_workers is set, items are
+        sent by chunks to worker processes, results are added in the same order as items
+        """
+        if not self.extract_workers:
+            for data in items:
+                self._extract_one(data)
+            return
+        items = list(items)
+        chunks = [items[i:i + self.extract_chunk_size]
+                  for i in range(0, len(items), self.extract_chunk_size)]
+        for objects, report, metrics, setter_stats in self._get_extract_pool().map(_extract_chunk, chunks):
+            if self.need_stop:
+                break
+            if self.intern_table is not None:
+                # Strings from worker are new objects after unpickling
+                objects = [self.intern_table.intern_record(record) for record in objects]
+            self.loaded_objects.extend(objects)
+            self._add_quality(report)
+            self.metrics.merge(metrics)
+            SetterProfiler.merge(setter_stats)
+
+    def _extract_one(self, data):
+        # extract_data time includes final_check of the lot (it is also timed separately)
+        if not self.metrics.enabled:
+            return self.extract_data(data)
+        try:
+            with self.metrics.timer('extract_data'):
+                self.extract_data(data)
+        except Exception:
+            self.metrics.incr('extract_failed')
+            raise
 
     def save_JS_obj(self, obj, extract=True):
         if obj and not self.need_stop:
             if not obj.complex:
                 obj.complex = self.complex_name
-            if extract:
-                obj.final_check()
+            pipeline_put = getattr(self._pipeline_local, 'put', None)
+            if extract and pipeline_put:
+                pipeline_put(obj)
+            elif extract:
+                self._final_check(obj)
                 self.loaded_objects.append(obj.pre_json())
+                self.metrics.incr('lots_saved')
             else:
                 self.preloaded_objects.append(obj)
 
+    def _get_json(self, url, **kwargs):
+        with self.metrics.timer('http'):
+            req = self.session.get(url, **kwargs)
+        try:
+            req.raise_for_status()
+            if not self.metrics.enabled:
+                return req.json()
+            content = req.content
+            self.metrics.incr('http_requests')
+            self.metrics.incr('http_bytes', len(content))
+            with self.metrics.timer('json_decode'):
+                return json.loads(content)
+        finally:
+            req.close()
+
+    def get_json(self, url, **kwargs):
+        if self.cache is None:
+            return self.retry_policy.call(self._get_json, url, **kwargs)
+        key = (url, json.dumps(kwargs.get('params'), sort_keys=True, default=str))
+        return self.cache.get_or_load(key, lambda: self.retry_policy.call(self._get_json, url, **kwargs))
+
+    def run_pipeline(self, tasks, emit=None, fetch_workers=2, extract_workers=1,
+                     check_workers=1, queue_size=1000):
+        """
+        Run fetch -> extract -> final_check -> emit as concurrent stages with bounded queues.
+        Parser must have fetch_items(task), which returns raw items (for extract_data)
+        of one task (category, page ...).
+        emit(record) get pre_json dicts as soon as they are checked, by default they are
+        saved to loaded_objects
+        """
+        if emit is None:
+            emit = self.loaded_objects.append
+
+        def fetch(task, put):
+            for data in self.fetch_items(task):
+                put(data)
+
+        def extract(data, put):
+            self._pipeline_local.put = put
+            self._extract_one(data)
+
+        def check(obj, put):
+            if not self.need_stop:
+                self._final_check(obj)
+                put(obj.pre_json())
+
+        def plans(record, put):
+            put(self.plan_downloader.attach_one(record, self.session, self.retry_policy))
+
+        def output(record, put):
+            emit(record)
+            self.metrics.incr('lots_saved')
+
+        pipeline = StagedPipeline(queue_size)
+        pipeline.add_stage('fetch', fetch, fetch_workers)
+        pipeline.add_stage('extract', extract, extract_workers)
+        pipeline.add_stage('check', check, check_workers)
+        if self.plan_downloader is not None:
+            pipeline.add_stage('plans', plans, self.plan_downloader.workers)
+        pipeline.add_stage('emit', output, 1)
+        pipeline.run(tasks)
+        if self.plan_downloader is not None:
+            self.plan_downloader.save_index()
+
+    def download_plans(self, records=None):
+        """
+        Load plan images of records (by default loaded_objects) with plan_downloader
+        and add plan_hash and plan_path to every record
+        """
+        if self.plan_downloader is None:
+            raise Exception('plan_dir is not set')
+        records = self.loaded_objects if records is None else records
+        # With concurrency controller pool has threads for its max limit, controller keeps real limit
+        workers = self.concurrency.max_limit if self.concurrency is not None else None
+        with self.metrics.timer('plans'):
+            self.plan_downloader.attach(records, self.session, self.retry_policy, workers)
+        for name, value in self.plan_downloader.stats.items():
+            self.metrics.incr('plans_' + name, value)
+        self.plan_downloader.stats.clear()
+        return records
+
+    def _final_check(self, obj):
+        if self.metrics.enabled:
+            try:
+                with self.metrics.timer('final_check'):
+                    result = obj.final_check()
+            except Exception:
+                self.metrics.incr('lots_failed')
+                raise
+            if not obj._need_save:
+                self.metrics.incr('lots_skipped')
+        else:
+            result = obj.final_check()
+        self._count_issues(obj)
+        return result
+
+    def _count_issues(self, obj):
+        with self._quality_lock:
+            self._checked_count += 1
+            if not obj._need_save:
+                self._skipped_count += 1
+            for issue in obj._issues:
+                self._issue_counts[issue.rule] += 1
+
+    def _add_quality(self, report):
+        with self._quality_lock:
+            self._checked_count += report['checked']
+            self._skipped_count += report['skipped']
+            self._issue_counts.update(report['issues'])
+
+    def reset_quality(self):
+        self._checked_count = 0
+        self._skipped_count = 0
+        self._issue_counts = Counter()
+
+    def quality_report(self):
+        """
+        Data quality of run: checked and skipped lots count and count of issues by rule
+        """
+        return {'checked': self._checked_count, 'skipped': self._skipped_count,
+                'issues': dict(self._issue_counts.most_common())}
+
     def convert_do_dict(self, del_same=False):
         converted_object = []
+        if self.batch_validation:
+            with self.metrics.timer('final_check_batch'):
+                BatchValidator().final_check(self.preloaded_objects)
+            for obj in self.preloaded_objects:
+                self._count_issues(obj)
+                if not obj._need_save:
+                    self.metrics.incr('lots_skipped')
         for obj in self.preloaded_objects:
             if hasattr(obj, 'id'):
                 del obj.id
-            obj.final_check()
+            if not self.batch_validation:
+                self._final_check(obj)
             if not del_same or obj.pre_json() not in converted_object:
                 converted_object.append(obj.pre_json())
         self.loaded_objects.extend(converted_object)
+        self.metrics.incr('lots_saved', len(converted_object))
+
+    def reset(self):
+        """
+        Clear results of previous run, so parser (with its session, pools and intern table)
+        can be used for next load_data
+        """
+        self.loaded_objects = []
+        self.preloaded_objects = []
+        self.loaded_links = []
+        self.need_stop = False
+        self.retry_policy.reset()
+        self.reset_quality()
+        if self.cache is not None:
+            self.cache.clear()
+        if self.profile_setters:
+            self._enable_profiler()
 
     def append_estate_link(self, link):
         if link in self.loaded_links:
             raise Exception('Link, was already loaded', link)
         self.loaded_links.append(link)
 
-    def output_result(self):
+    def unique_objects(self):
+        # Same as check `element not in output_list` (see Utils.record_key), but without scan of list
         output_list = []
-        for element in self.loaded_objects:
-            if element not in output_list:
-                output_list.append(element)
-        print(json.dumps(output_list, cls=DecimalEncoder, indent=1,
-                         sort_keys=False))
+        seen = set()
+        with self.metrics.timer('dedup'):
+            for element in self.loaded_objects:
+                key = Utils.record_key(element)
+                if key not in seen:
+                    seen.add(key)
+                    output_list.append(element)
+        return output_list
+
+    def output_result(self):
+        output_list = self.unique_objects()
+        with self.metrics.timer('serialize'):
+            print(json.dumps(output_list, cls=DecimalEncoder, indent=1,
+                             sort_keys=False))
+        if self.profile_setters:
+            SetterProfiler.print_table()
+            SetterProfiler.disable()
+            SetterProfiler.reset()
+
+
+class SQLiteStore:
+    """
+    Local sqlite store of lots. write(record) takes pre_json dicts (can be used as emit of
+    run_pipeline), records are upserted by batches in one transaction. Table `lots` keeps
+    the last state of every lot, `price_history` gets new row only if prices or in_sale
+    changed. changes(since) returns what changed and by how much (one indexed query).
+    """
+    price_fields = ['price_base', 'price_sale', 'price_finished', 'price_finished_sale']
+    schema = """
+        CREATE TABLE IF NOT EXISTS lots (
+            key TEXT PRIMARY KEY, complex TEXT, type TEXT, rooms, floor INTEGER, area REAL,
+            in_sale INTEGER, price_base INTEGER, price_sale INTEGER, price_finished INTEGER,
+            price_finished_sale INTEGER, data TEXT, first_seen TEXT, last_seen TEXT);
+        CREATE INDEX IF NOT EXISTS lots_complex ON lots (complex, type, rooms);
+        CREATE INDEX IF NOT EXISTS lots_type ON lots (type);
+        CREATE INDEX IF NOT EXISTS lots_rooms ON lots (rooms);
+        CREATE INDEX IF NOT EXISTS lots_in_sale ON lots (in_sale);
+        CREATE INDEX IF NOT EXISTS lots_price ON lots (price_base);
+        CREATE TABLE IF NOT EXISTS price_history (
+            key TEXT, seen_at TEXT, in_sale INTEGER, price_base INTEGER, price_sale INTEGER,
+            price_finished INTEGER, price_finished_sale INTEGER);
+        CREATE INDEX IF NOT EXISTS price_history_key ON price_history (key, seen_at);
+        CREATE INDEX IF NOT EXISTS price_history_seen ON price_history (seen_at);
+    """
+    columns = ['key', 'complex', 'type', 'rooms', 'floor', 'area', 'in_sale'] + price_fields + ['data']
+
+    def __init__(self, path, batch_size=2000):
+        import sqlite3
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.schema)
+        self.connection.execute(f'CREATE TEMP TABLE incoming ({", ".join(self.columns)})')
+        self.batch_size = batch_size
+        self.run_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def lot_key(record):
+        if record.get('flat_url'):
+            return record['flat_url']
+        return '|'.join(str(record.get(name)) for name in
+                        ('complex', 'type', 'building', 'section', 'number', 'floor', 'area'))
+
+    @staticmethod
+    def _number(value):
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        return value
+
+    def write(self, record):
+        row = [self.lot_key(record)]
+        row += [self._number(record.get(name)) for name in self.columns[1:-1]]
+        row.append(json.dumps(record, cls=DecimalEncoder, ensure_ascii=False))
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        prices = ', '.join(self.price_fields)
+        changed = ' OR '.join(f'l.{name} IS NOT i.{name}' for name in self.price_fields + ['in_sale'])
+        updates = ', '.join(f'{name} = excluded.{name}' for name in self.columns[1:])
+        with self.connection:
+            self.connection.execute('DELETE FROM incoming')
+            self.connection.executemany(
+                f'INSERT INTO incoming VALUES ({", ".join("?" * len(self.columns))})', self._buffer)
+            self.connection.execute(
+                f'INSERT INTO price_history (key, seen_at, in_sale, {prices}) '
+                f'SELECT i.key, ?, i.in_sale, {", ".join("i." + name for name in self.price_fields)} '
+                f'FROM incoming i LEFT JOIN lots l ON l.key = i.key WHERE l.key IS NULL OR {changed}',
+                (self.run_at,))
+            self.connection.execute(
+                f'INSERT INTO lots ({", ".join(self.columns)}, first_seen, last_seen) '
+                f'SELECT *, ?, ? FROM incoming WHERE true '
+                f'ON CONFLICT (key) DO UPDATE SET {updates}, last_seen = excluded.last_seen',
+                (self.run_at, self.run_at))
+        self._buffer = []
+
+    def mark_missing(self, complex_name):
+        """
+        Lots of complex, which were not written in this run, are marked as not in sale
+        """
+        self.flush()
+        prices = ', '.join(self.price_fields)
+        condition = 'complex = ? AND last_seen < ? AND in_sale != 0'
+        with self.connection:
+            self.connection.execute(
+                f'INSERT INTO price_history (key, seen_at, in_sale, {prices}) '
+                f'SELECT key, ?, 0, {prices} FROM lots WHERE {condition}',
+                (self.run_at, complex_name, self.run_at))
+            self.connection.execute(f'UPDATE lots SET in_sale = 0 WHERE {condition}', (complex_name, self.run_at))
+
+    def mark_removed(self, keys):
+        """
+        Lots with these keys are marked as not in sale (mark_missing for runs,
+        which write only changed lots)
+        """
+        self.flush()
+        prices = ', '.join(self.price_fields)
+        with self.connection:
+            for key in keys:
+                self.connection.execute(
+                    f'INSERT INTO price_history (key, seen_at, in_sale, {prices}) '
+                    f'SELECT key, ?, 0, {prices} FROM lots WHERE key = ? AND in_sale != 0', (self.run_at, key))
+                self.connection.execute('UPDATE lots SET in_sale = 0, last_seen = ? WHERE key = ?',
+                                        (self.run_at, key))
+
+    def changes(self, since):
+        """
+        Price and in_sale changes from `since` ('YYYY-MM-DD[ HH:MM:SS]') with previous values
+        """
+        previous = ', '.join(
+            f'(SELECT p.{name} FROM price_history p WHERE p.key = h.key AND p.seen_at < h.seen_at '
+            f'ORDER BY p.seen_at DESC LIMIT 1) AS old_{name}' for name in self.price_fields + ['in_sale'])
+        cursor = self.connection.execute(
+            f'SELECT h.key, l.complex, l.type, l.rooms, h.seen_at, h.in_sale, '
+            f'{", ".join("h." + name for name in self.price_fields)}, {previous} '
+            f'FROM price_history h JOIN lots l ON l.key = h.key WHERE h.seen_at >= ? ORDER BY h.seen_at',
+            (since,))
+        names = [column[0] for column in cursor.description]
+        result = []
+        for row in cursor:
+            item = dict(zip(names, row))
+            for name in self.price_fields:
+                if item[name] is not None and item['old_' + name] is not None:
+                    item[name + '_change'] = item[name] - item['old_' + name]
+            result.append(item)
+        return result
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+class ColumnarExport:
+    """
+    Write lots (pre_json dicts) as typed columnar file: Arrow IPC (default, uncompressed,
+    can be memory-mapped and read without parsing) or Parquet. Needs pyarrow.
+    Prices are int64, area/ceil/discount_percent decimal128, floor int16,
+    repeated strings are dictionary-encoded, feature/view are list<string>.
+    rooms: 0 is studio (EstateObject never keeps 0 rooms), finished/furniture: 2 is 'optional'
+    """
+    dictionary_fields = ['complex', 'type', 'comissioning', 'sale_status', 'building', 'section',
+                         'finishing_name', 'sale', 'currency']
+    int64_fields = ['price', 'price_base', 'price_sale', 'price_finished', 'price_finished_sale',
+                    'furniture_price', 'discount']
+    decimal_fields = ['area', 'living_area', 'ceil', 'discount_percent']
+    int8_fields = ['in_sale', 'finished', 'furniture', 'euro_planning']
+    list_fields = ['feature', 'view']
+    enum_values = {'optional': 2, 'studio': 0}
+
+    def __init__(self, decimal_precision=16, decimal_scale=4):
+        try:
+            import pyarrow
+        except ImportError:
+            raise Exception('Columnar export needs pyarrow package: pip install pyarrow')
+        self.pa = pyarrow
+        self.decimal_type = pyarrow.decimal128(decimal_precision, decimal_scale)
+        self.quantum = Decimal(1).scaleb(-decimal_scale)
+
+    def _field_type(self, name):
+        pa = self.pa
+        if name in self.dictionary_fields:
+            return pa.dictionary(pa.int32(), pa.string())
+        if name in self.int64_fields:
+            return pa.int64()
+        if name in self.decimal_fields:
+            return self.decimal_type
+        if name in self.int8_fields:
+            return pa.int8()
+        if name in ('floor', 'rooms'):
+            return pa.int16()
+        if name in self.list_fields:
+            return pa.list_(pa.string())
+        return pa.string()
+
+    def _convert(self, name, value):
+        if value is None:
+            return None
+        if name in self.list_fields:
+            return [value] if isinstance(value, str) else [str(item) for item in value]
+        if name in self.decimal_fields:
+            return Decimal(value).quantize(self.quantum)
+        if name in self.int64_fields or name in self.int8_fields or name in ('floor', 'rooms'):
+            return self.enum_values.get(value, value) if isinstance(value, str) else int(value)
+        return str(value)
+
+    def table(self, records):
+        pa = self.pa
+        names = []
+        for record in records:
+            for name in record:
+                if name not in names:
+                    names.append(name)
+        fields, arrays = [], []
+        for name in names:
+            field_type = self._field_type(name)
+            values = [self._convert(name, record.get(name)) for record in records]
+            if pa.types.is_dictionary(field_type):
+                array = pa.array(values, pa.string()).dictionary_encode()
+            else:
+                array = pa.array(values, field_type)
+            fields.append(pa.field(name, array.type))
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    def write(self, records, path, file_format=None):
+        """
+        file_format: 'arrow' or 'parquet', by default by extension of path (.parquet)
+        """
+        table = self.table(list(records))
+        file_format = file_format or ('parquet' if path.endswith('.parquet') else 'arrow')
+        if file_format == 'parquet':
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(table, path)
+        else:
+            with self.pa.OSFile(path, 'wb') as sink:
+                with self.pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        return table
+
+    def read(self, path):
+        # Arrow IPC file is memory-mapped, columns are not copied or parsed
+        if path.endswith('.parquet'):
+            import pyarrow.parquet
+
+            return pyarrow.parquet.read_table(path)
+        return self.pa.ipc.open_file(self.pa.memory_map(path, 'r')).read_all()
+
+
+# Parsers for BatchRunner: name -> (parser class, kwargs for it)
+PARSER_REGISTRY = {}
+
+
+def register_parser(name, **parser_kwargs):
+    """
+    Class decorator, add parser to PARSER_REGISTRY, e.g.
+    @register_parser('murinoclub', url_base='...', complex_name='...')
+    """
+    def decorator(parser_class):
+        PARSER_REGISTRY[name] = (parser_class, parser_kwargs)
+        return parser_class
+    return decorator
+
+
+class BatchRunner:
+    """
+    Run many parsers in one process (threads) with one Transport, ResponseCache and serializer.
+    Result is one json: {"objects": [...all lots...], "summary": {name: {time, count, error}}}
+    Registry can be PARSER_REGISTRY or json file: {"name": {"parser": "module:Class", ...kwargs}}
+    """
+
+    def __init__(self, registry=None, transport=None, cache=None, workers=8):
+        self.registry = PARSER_REGISTRY if registry is None else registry
+        self.transport = transport or Transport(verify=False)
+        self.cache = cache or ResponseCache()
+        self.workers = workers
+        self.summary = {}
+
+    @staticmethod
+    def load_registry(path):
+        import importlib
+
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        registry = {}
+        for name, kwargs in config.items():
+            kwargs = dict(kwargs)
+            module_name, class_name = kwargs.pop('parser').split(':')
+            registry[name] = (getattr(importlib.import_module(module_name), class_name), kwargs)
+        return registry
+
+    def _run_one(self, name):
+        parser_class, kwargs = self.registry[name]
+        started = time.monotonic()
+        parser = parser_class(transport=self.transport, cache=self.cache, **kwargs)
+        try:
+            parser.load_data()
+        finally:
+            parser.close_extract_pool()
+        return parser, time.monotonic() - started
+
+    def run(self, names=None, stream=None):
+        names = list(names or self.registry)
+        stream = stream or sys.stdout
+        output = JSONStreamOutput(stream, prefix='{"objects": ')
+        self.summary = {}
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._run_one, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    parser, spent = future.result()
+                except Exception as e:
+                    self.summary[name] = {'time': None, 'count': 0, 'error': repr(e)}
+                    continue
+                objects = parser.unique_objects()
+                for element in objects:
+                    output.write(element)
+                self.summary[name] = {'time': round(spent, 3), 'count': len(objects), 'error': None}
+        output.close(end='')
+        stream.write(', "summary": ' + json.dumps(self.summary, ensure_ascii=False, indent=1) + '}\n')
+        stream.flush()
+        return self.summary
+
+
+def batch(registry_path=None, *names):
+    registry = BatchRunner.load_registry(registry_path) if registry_path else None
+    BatchRunner(registry).run(names)
+
+
+class RequestBudget:
+    """
+    Global limit of requests of all parsers: token bucket with per_hour refill rate
+    and `burst` tokens at most (by default 1/10 of hour)
+    """
+
+    def __init__(self, per_hour, burst=None):
+        self.rate = per_hour / 3600
+        self.burst = burst or max(1, per_hour / 10)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost):
+        # Run more expensive than burst is started with full bucket
+        self._refill()
+        missing = min(cost, self.burst) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else float('inf')
+
+    def spend(self, cost):
+        self._refill()
+        self.tokens -= cost
+
+
+class PollingDaemon:
+    """
+    Long-running replacement of price() from cron. Parsers of registry are created once
+    and kept with shared Transport (warm sessions) between runs. Every complex is polled
+    with its own interval: rate of changed lots (diff of consecutive loaded_objects) is
+    smoothed, interval = target_changes / rate (min_interval..max_interval), without
+    changes interval is doubled. All runs share RequestBudget of requests_per_hour, every
+    run is charged by requests sent by parser (CountingSession, retries included).
+    Every run writes only delta as json line to stream:
+    {"complex", "at", "lots", "added": [...], "changed": [...], "removed": [keys], "next_run_in"}
+    and to SQLiteStore, if set. The first run of complex has all lots in added.
+    """
+
+    def __init__(self, registry=None, names=None, transport=None, stream=None, store=None,
+                 min_interval=60, max_interval=3600, target_changes=5, smoothing=0.5,
+                 requests_per_hour=600):
+        self.registry = PARSER_REGISTRY if registry is None else registry
+        self.names = list(names or self.registry)
+        self.transport = transport or Transport(verify=False)
+        self.stream = stream or sys.stdout
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_changes = target_changes
+        self.smoothing = smoothing
+        self.budget = RequestBudget(requests_per_hour)
+        self.stop_event = threading.Event()
+        self.parsers = {}
+        self.state = {}
+
+    def _parser(self, name):
+        if name not in self.parsers:
+            parser_class, kwargs = self.registry[name]
+            kwargs = dict({'intern_strings': True}, **kwargs)
+            parser = parser_class(transport=self.transport, metrics=Metrics(), **kwargs)
+            # Budget is charged by requests sent, not by loaded pages
+            parser.session = CountingSession(parser.session)
+            self.parsers[name] = parser
+        return self.parsers[name]
+
+    @staticmethod
+    def diff(old, new):
+        """
+        old, new - {lot_key: record}. Return added and changed records and removed keys
+        """
+        added, changed = [], []
+        for key, record in new.items():
+            before = old.get(key)
+            if before is None:
+                added.append(record)
+            elif before != record:
+                changed.append(record)
+        removed = [key for key in old if key not in new]
+        return added, changed, removed
+
+    def _next_interval(self, state, changes, now):
+        if state['last_run'] is None:
+            return state['interval']
+        rate = changes / max(now - state['last_run'], 1e-9)
+        state['rate'] = rate if state['rate'] is None else \
+            state['rate'] + self.smoothing * (rate - state['rate'])
+        if not changes and state['rate'] * state['interval'] < self.target_changes:
+            interval = state['interval'] * 2
+        else:
+            interval = self.target_changes / state['rate'] if state['rate'] else self.max_interval
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _write_delta(self, name, parser, records, added, changed, removed, next_run_in):
+        line = {'complex': name, 'at': time.strftime('%Y-%m-%d %H:%M:%S'), 'lots': len(records),
+                'added': added, 'changed': changed, 'removed': removed, 'next_run_in': round(next_run_in, 1),
+                'quality': parser.quality_report()}
+        self.stream.write(json.dumps(line, cls=DecimalEncoder, ensure_ascii=False) + '\n')
+        self.stream.flush()
+        if self.store is not None:
+            self.store.run_at = line['at']
+            self.store.write_many(added + changed)
+            self.store.mark_removed(removed)
+
+    def run_once(self, name):
+        """
+        Load complex, write delta with previous run and return seconds to its next run
+        """
+        state = self.state.setdefault(name, {'snapshot': None, 'rate': None, 'interval': self.min_interval,
+                                             'last_run': None, 'cost': 1, 'runs': 0, 'errors': 0})
+        parser = None
+        requests_before = 0
+        try:
+            # Parser of registry can fail on creation too, other complexes are polled anyway
+            parser = self._parser(name)
+            requests_before = parser.session.requests
+            parser.reset()
+            parser.load_data()
+            records = {SQLiteStore.lot_key(record): record for record in parser.unique_objects()}
+        except Exception as e:
+            state['errors'] += 1
+            logger.warning(f'{name} is not loaded: {e!r}')
+            # Errors don't change rate, complex is polled less often until it is loaded
+            state['interval'] = min(self.max_interval, state['interval'] * 2)
+            return state['interval']
+        finally:
+            state['cost'] = max(1, parser.session.requests - requests_before) if parser is not None else 1
+            self.budget.spend(state['cost'])
+        now = time.monotonic()
+        added, changed, removed = self.diff(state['snapshot'] or {}, records)
+        changes = len(added) + len(changed) + len(removed) if state['snapshot'] is not None else 0
+        state['interval'] = self._next_interval(state, changes, now)
+        state['snapshot'] = records
+        state['last_run'] = now
+        state['runs'] += 1
+        self._write_delta(name, parser, records, added, changed, removed, state['interval'])
+        return state['interval']
+
+    def run(self, max_runs=None):
+        """
+        Poll complexes until stop() (or max_runs runs of all complexes together)
+        """
+        import heapq
+
+        schedule = [(time.monotonic(), name) for name in self.names]
+        heapq.heapify(schedule)
+        runs = 0
+        try:
+            while schedule and not self.stop_event.is_set() and (max_runs is None or runs < max_runs):
+                due, name = heapq.heappop(schedule)
+                if self.stop_event.wait(max(0.0, due - time.monotonic())):
+                    break
+                wait = self.budget.wait_time(self.state[name]['cost'] if name in self.state else 1)
+                if wait > 0:
+                    # Budget is spent, complex waits for tokens (others with earlier time go first)
+                    heapq.heappush(schedule, (time.monotonic() + wait, name))
+                    continue
+                heapq.heappush(schedule, (time.monotonic() + self.run_once(name), name))
+                runs += 1
+        finally:
+            self.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        for parser in self.parsers.values():
+            parser.close_extract_pool()
+        if self.store is not None:
+            self.store.flush()
+        self.transport.close()
+
+
+def daemon(registry_path=None, *names):
+    import signal
+
+    registry = BatchRunner.load_registry(registry_path) if registry_path else None
+    polling = PollingDaemon(registry, names)
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *args: polling.stop())
+    polling.run()
 
 # Parser Script V1.14
 # ___________________________PARSER_UNIQUE_BODY_______________________________________
 
 
+@register_parser('murinoclub', url_base='https://murinoclub.ru/api/estateSearch/',
+                 complex_name='Мурино Клаб (Санкт-Петербург)')
 class Parser(BaseParser):
+    art_codes = ['flat', 'parking_underground', 'parking', 'store']
+
+    def fetch_items(self, art_code):
+        return list(self.get_json(self.url_base)['data']['flats'].values())
+
     def parse_estate(self, art_code):
-        with self.session.get(self.url_base, verify=False) as req:
-            loaded = req.json()['data']['flats']
-            for estate in loaded:
-                self.extract_data(loaded[estate])
+        self.extract_many(self.fetch_items(art_code))
 
     def load_data(self):
-        art_codes = ['flat', 'parking_underground', 'parking', 'store']
-        for art_code in art_codes:
+        for art_code in self.art_codes:
             self.parse_estate(art_code)
 
+    def stream_data(self):
+        output = JSONStreamOutput()
+        self.run_pipeline(self.art_codes, emit=output.write)
+        output.close()
+
     def get_flat_url(self, link):
         return f"https://murinoclub.ru{link}"
 
     def extract_data(self, data, head=None):
-        obj = EstateObject(self.url_base)
+        obj = EstateObject(self.url_base, **self.object_options)
 
         obj.flat_url = self.get_flat_url(data['link'])
         obj.set_obj_type('flat')
@@ -1140,12 +3453,39 @@ class Parser(BaseParser):
         self.save_JS_obj(obj)
 
 
-def price():
-    parser = Parser(url_base='https://murinoclub.ru/api/estateSearch/',
-                    complex_name='Мурино Клаб (Санкт-Петербург)')
-    parser.load_data()
+def price(stream=False, url_base='https://murinoclub.ru/api/estateSearch/', store=None, export=None,
+          plan_dir=None):
+    parser = Parser(url_base=url_base,
+                    complex_name='Мурино Клаб (Санкт-Петербург)',
+                    transport=Transport(verify=False),
+                    plan_dir=plan_dir)
+    if stream:
+        # Lots are printed while other categories are still loading
+        parser.stream_data()
+        return
+    try:
+        parser.load_data()
+    finally:
+        parser.close_extract_pool()
+    if plan_dir:
+        # Plan images are saved to plan_dir, records get plan_hash and plan_path
+        parser.download_plans()
+    if store:
+        # Path of sqlite file, lots are saved there too (see SQLiteStore.changes for report)
+        lots = SQLiteStore(store)
+        lots.write_many(parser.unique_objects())
+        lots.mark_missing(parser.complex_name)
+        lots.close()
+    if export:
+        # .arrow (memory-mappable) or .parquet file for analytics
+        ColumnarExport().write(parser.unique_objects(), export)
     parser.output_result()
 
 
 if __name__ == "__main__":
-    price()
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch(*sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        daemon(*sys.argv[2:])
+    else:
+        price()